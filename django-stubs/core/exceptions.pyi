@@ -1,7 +1,6 @@
 from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
 
 from django.db.models.base import Model
-from django.forms.utils import ErrorDict
 
 class FieldDoesNotExist(Exception): ...
 class AppRegistryNotReady(Exception): ...
@@ -43,9 +42,7 @@ class ValidationError(Exception):
     def message_dict(self) -> Dict[str, List[str]]: ...
     @property
     def messages(self) -> List[str]: ...
-    def update_error_dict(
-        self, error_dict: Union[Dict[str, List[ValidationError]], ErrorDict]
-    ) -> Union[Dict[str, List[ValidationError]], ErrorDict]: ...
+    def update_error_dict(self, error_dict: Dict[str, List[ValidationError]]) -> Dict[str, List[ValidationError]]: ...
     def __iter__(self) -> Iterator[Union[Tuple[str, List[str]], str]]: ...
 
 class EmptyResultSet(Exception): ...
@@ -7,7 +7,6 @@ from django.db.models import Model
 from django.core.exceptions import FieldDoesNotExist as FieldDoesNotExist
 from django.db.models.expressions import Combinable
 from django.db.models.query_utils import RegisterLookupMixin
-from django.forms import Field as FormField, Widget
 from typing_extensions import Literal
 
 from .mixins import NOT_PROVIDED as NOT_PROVIDED
@@ -28,7 +27,8 @@ class Field(RegisterLookupMixin, Generic[_ST, _GT]):
     _pyi_private_set_type: Any
     _pyi_private_get_type: Any
 
-    widget: Widget
+    # not django.forms types, importing django.forms here makes django.db.models load most of django-stubs
+    widget: Any
     help_text: str
     db_table: str
     remote_field: Field
@@ -67,7 +67,7 @@ class Field(RegisterLookupMixin, Generic[_ST, _GT]):
     def db_parameters(self, connection: Any) -> Dict[str, str]: ...
     def get_prep_value(self, value: Any) -> Any: ...
     def get_internal_type(self) -> str: ...
-    def formfield(self, **kwargs) -> FormField: ...
+    def formfield(self, **kwargs) -> Any: ...
     def contribute_to_class(self, cls: Type[Model], name: str, private_only: bool = ...) -> None: ...
     def to_python(self, value: Any) -> Any: ...
 
@@ -7,7 +7,6 @@ from django.core.files.storage import FileSystemStorage, Storage
 from django.db.models.base import Model
 
 from django.db.models.fields import Field, _FieldChoices, _ValidatorCallable, _ErrorMessagesToOverride
-from django.forms import fields as form_fields
 
 BLANK_CHOICE_DASH: List[Tuple[str, str]] = ...
 
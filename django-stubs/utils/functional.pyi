@@ -1,7 +1,7 @@
-from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union
 from functools import wraps as wraps
 
-from django.db.models.base import Model
+_T = TypeVar("_T")
 
 def curry(_curried_func: Any, *args: Any, **kwargs: Any): ...
 
@@ -28,7 +28,7 @@ class LazyObject:
     __getattr__: Any = ...
     def __setattr__(self, name: str, value: Any) -> None: ...
     def __delattr__(self, name: str) -> None: ...
-    def __reduce__(self) -> Tuple[Callable, Tuple[Model]]: ...
+    def __reduce__(self) -> Tuple[Callable, Tuple[Any]]: ...
     def __copy__(self): ...
     def __deepcopy__(self, memo: Any): ...
     __bytes__: Any = ...
@@ -44,11 +44,11 @@ class LazyObject:
     __len__: Any = ...
     __contains__: Any = ...
 
-def unpickle_lazyobject(wrapped: Model) -> Model: ...
+def unpickle_lazyobject(wrapped: _T) -> _T: ...
 
 class SimpleLazyObject(LazyObject):
     def __init__(self, func: Callable) -> None: ...
     def __copy__(self) -> List[int]: ...
     def __deepcopy__(self, memo: Dict[Any, Any]) -> List[int]: ...
 
-def partition(predicate: Callable, values: List[Model]) -> Tuple[List[Model], List[Model]]: ...
+def partition(predicate: Callable, values: List[_T]) -> Tuple[List[_T], List[_T]]: ...
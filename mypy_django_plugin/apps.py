@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, Tuple
+
+from mypy.nodes import ClassDef, ListExpr, MypyFile, NameExpr, StrExpr, TupleExpr, TypeInfo
+from mypy_django_plugin import helpers
+from mypy_django_plugin.transformers.settings import ImportStarClosure
+
+
+def get_str_assignments(defn: ClassDef) -> Dict[str, str]:
+    assignments = {}
+    for lvalue, rvalue in helpers.iter_over_assignments(defn):
+        if isinstance(lvalue, NameExpr) and isinstance(rvalue, StrExpr):
+            assignments[lvalue.name] = rvalue.value
+    return assignments
+
+
+def get_meta_app_label(model_classdef: ClassDef) -> Optional[str]:
+    for stmt in model_classdef.defs.body:
+        if isinstance(stmt, ClassDef) and stmt.name == 'Meta':
+            return get_str_assignments(stmt).get('app_label')
+    return None
+
+
+def get_default_app_module(module_name: str) -> str:
+    # app is a package containing models.py or models/ package
+    parts = module_name.split('.')
+    if 'models' in parts[1:]:
+        return '.'.join(parts[:parts.index('models', 1)])
+    return '.'.join(parts[:-1]) or module_name
+
+
+class AppsRegistry:
+    """
+    Model classes by ("app_label", "ModelName"), both compared case-insensitively, like
+    django.apps.apps.get_model() does.
+
+    Apps and their labels are read from INSTALLED_APPS of the settings module and AppConfig classes
+    it references, models are registered by the model base class hook. Models not seen by the hook
+    (loaded from incremental cache) are looked up in "<app module>.models" and remembered.
+    """
+
+    def __init__(self, settings_modules: List[str], import_star_closure: ImportStarClosure) -> None:
+        self.settings_modules = settings_modules
+        self.import_star_closure = import_star_closure
+        # tree of the settings module app labels were read from
+        self.settings_file: Optional[MypyFile] = None
+        # lowercased app label -> app module
+        self.app_modules: Dict[str, str] = {}
+        # app module -> app label
+        self.app_labels: Dict[str, str] = {}
+        # (lowercased app label, lowercased model name) -> model fullname
+        self.models: Dict[Tuple[str, str], str] = {}
+
+    def get_installed_apps(self, all_modules: Dict[str, MypyFile]) -> List[str]:
+        settings_module = self.settings_modules[-1]
+        installed_apps: List[str] = []
+        for module_name in [*self.import_star_closure.get_closure(all_modules, settings_module), settings_module]:
+            module_file = all_modules.get(module_name)
+            if module_file is None:
+                continue
+            for lvalue, rvalue in helpers.iter_over_assignments(module_file):
+                if (isinstance(lvalue, NameExpr) and lvalue.name == 'INSTALLED_APPS'
+                        and isinstance(rvalue, (ListExpr, TupleExpr))):
+                    installed_apps = [item.value for item in rvalue.items if isinstance(item, StrExpr)]
+        return installed_apps
+
+    def find_app_config(self, app_entry: str, all_modules: Dict[str, MypyFile]) -> Optional[Dict[str, str]]:
+        # 'myapp.apps.MyAppConfig'
+        module_name, _, class_name = app_entry.rpartition('.')
+        module_file = all_modules.get(module_name)
+        if module_file is not None:
+            for defn in module_file.defs:
+                if isinstance(defn, ClassDef) and defn.name == class_name:
+                    return get_str_assignments(defn)
+
+        # 'myapp', with AppConfig for it in myapp/apps.py
+        apps_file = all_modules.get(app_entry + '.apps')
+        if apps_file is not None:
+            for defn in apps_file.defs:
+                if isinstance(defn, ClassDef):
+                    app_config = get_str_assignments(defn)
+                    if app_config.get('name') == app_entry:
+                        return app_config
+        return None
+
+    def update_apps(self, all_modules: Dict[str, MypyFile]) -> None:
+        settings_file = all_modules.get(self.settings_modules[-1])
+        if settings_file is None or settings_file is self.settings_file:
+            return None
+
+        self.settings_file = settings_file
+        self.app_modules.clear()
+        self.app_labels.clear()
+        for app_entry in self.get_installed_apps(all_modules):
+            app_config = self.find_app_config(app_entry, all_modules) or {}
+            app_module = app_config.get('name', app_entry)
+            app_label = app_config.get('label', app_module.rpartition('.')[2])
+            self.app_modules[app_label.lower()] = app_module
+            self.app_labels[app_module] = app_label
+
+    def get_app_label(self, module_name: str) -> str:
+        # app with the longest name containing the module, as in django.apps.apps.get_containing_app_config()
+        candidates = [app_module for app_module in self.app_labels
+                      if module_name == app_module or module_name.startswith(app_module + '.')]
+        if candidates:
+            return self.app_labels[max(candidates, key=len)]
+        return get_default_app_module(module_name).rpartition('.')[2]
+
+    def register_model(self, model_info: TypeInfo, all_modules: Dict[str, MypyFile]) -> None:
+        self.update_apps(all_modules)
+        app_label = get_meta_app_label(model_info.defn) or self.get_app_label(model_info.module_name)
+        self.models[(app_label.lower(), model_info.name().lower())] = model_info.fullname()
+
+    def get_model_fullname(self, app_label: str, model_name: str,
+                           all_modules: Dict[str, MypyFile]) -> Optional[str]:
+        key = (app_label.lower(), model_name.lower())
+        if key in self.models:
+            return self.models[key]
+
+        self.update_apps(all_modules)
+        app_module = self.app_modules.get(app_label.lower(), app_label)
+        model_fullname = helpers.get_model_fullname(app_module, model_name, all_modules)
+        if model_fullname is not None:
+            self.models[key] = model_fullname
+        return model_fullname
+
+    def get_model_fullname_from_string(self, model_string: str,
+                                       all_modules: Dict[str, MypyFile]) -> Optional[str]:
+        if model_string == 'self':
+            raise helpers.SelfReference()
+
+        if '.' not in model_string:
+            raise helpers.SameFileModel(model_string)
+
+        app_label, _, model_name = model_string.rpartition('.')
+        return self.get_model_fullname(app_label, model_name, all_modules)
@@ -1,5 +1,6 @@
+import os
 from configparser import ConfigParser
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from dataclasses import dataclass
 
@@ -8,6 +9,11 @@ from dataclasses import dataclass
 class Config:
     django_settings_module: Optional[str] = None
     ignore_missing_settings: bool = False
+    lazy_settings: bool = False
+    apps_snapshot: Optional[str] = None
+    model_schema: Optional[str] = None
+    model_schema_export: Optional[str] = None
+    hooks_profile_report: Optional[str] = None
 
     @classmethod
     def from_config_file(cls, fpath: str) -> 'Config':
@@ -22,4 +28,36 @@ class Config:
             django_settings = django_settings.strip()
         return Config(django_settings_module=django_settings,
                       ignore_missing_settings=ini_config.get('mypy_django_plugin', 'ignore_missing_settings',
-                                                             fallback=False))
+                                                             fallback=False),
+                      lazy_settings=ini_config.getboolean('mypy_django_plugin', 'lazy_settings',
+                                                          fallback=False),
+                      apps_snapshot=ini_config.get('mypy_django_plugin', 'apps_snapshot', fallback=None),
+                      model_schema=ini_config.get('mypy_django_plugin', 'model_schema', fallback=None),
+                      model_schema_export=ini_config.get('mypy_django_plugin', 'model_schema_export',
+                                                         fallback=None),
+                      hooks_profile_report=ini_config.get('mypy_django_plugin', 'hooks_profile_report',
+                                                          fallback=None))
+
+    @classmethod
+    def from_environment(cls) -> 'Config':
+        config_fpath = os.environ.get('MYPY_DJANGO_CONFIG', 'mypy_django.ini')
+        if config_fpath and os.path.exists(config_fpath):
+            config = cls.from_config_file(config_fpath)
+        else:
+            config = cls()
+        if 'DJANGO_SETTINGS_MODULE' in os.environ:
+            config.django_settings_module = os.environ['DJANGO_SETTINGS_MODULE']
+        return config
+
+    def get_settings_modules(self) -> List[str]:
+        settings_modules = ['django.conf.global_settings']
+        if self.django_settings_module:
+            settings_modules.append(self.django_settings_module)
+        return settings_modules
+
+    def get_settings_config_data(self) -> Dict[str, Any]:
+        """Options which change the analyzed django.conf"""
+        return {'settings_modules': self.get_settings_modules(),
+                'ignore_missing_settings': self.ignore_missing_settings,
+                'lazy_settings': self.lazy_settings,
+                'model_schema': self.model_schema}
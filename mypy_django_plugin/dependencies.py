@@ -0,0 +1,364 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from mypy import build
+from mypy.errors import Errors
+from mypy.fscache import FileSystemCache
+from mypy.modulefinder import SearchPaths
+from mypy.nodes import ClassDef, ListExpr, MypyFile, NameExpr, StrExpr, TupleExpr
+from mypy.options import Options
+from mypy.plugin import Plugin
+from mypy.version import __version__ as mypy_version
+from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import get_str_assignments
+from mypy_django_plugin.transformers.models import extract_to_expr, get_callee_fullname, is_related_field, \
+    iter_call_assignments, iter_over_classdefs
+from mypy_django_plugin.schema import ModelSchema
+from mypy_django_plugin.transformers.settings import iter_over_import_star_modules
+
+
+def get_models_module_from_model_string(model_string: str) -> Optional[str]:
+    if '.' not in model_string:
+        # 'self' or model from the same file
+        return None
+    app_label, _, _ = model_string.rpartition('.')
+    return app_label + '.models'
+
+
+def is_app_config_class(defn: ClassDef, module_file: MypyFile) -> bool:
+    return any(get_callee_fullname(base_expr, module_file) in {'django.apps.AppConfig', 'django.apps.config.AppConfig'}
+               for base_expr in defn.base_type_exprs)
+
+
+def create_cache_build_manager(options: Options) -> build.BuildManager:
+    """Manager of an empty build, to access the cache as mypy does, plugins are loaded before mypy creates one"""
+    return build.BuildManager(data_dir='', search_paths=SearchPaths((), (), (), ()), ignore_prefix=os.getcwd(),
+                              source_set=build.BuildSourceSet([]), reports=None, options=options,
+                              version_id=mypy_version, plugin=Plugin(options), plugins_snapshot={},
+                              errors=Errors(), flush_errors=lambda messages, serious: None,
+                              fscache=FileSystemCache())
+
+
+class RelatedModulesStore:
+    """
+    Modules declaring related fields to models of a module, and related managers they add, persisted next to
+    the incremental cache.
+
+    Referenced module does not depend on declaring modules, which import it, related managers are typed with
+    their model by the attribute hook (see AddRelatedManagers). Its cache is invalidated, when sources of
+    declaring modules change, or new ones are recorded: mypy>=0.750 compares report_config_data(), for older
+    versions options are passed, and cache metadata of such modules is removed before the next build starts.
+With options, all cache metadata is removed when the settings configuration (config_hash) changes: plugins
+snapshot of mypy is not enough, it is compared only for modules loaded by the build which writes it.
+    Related managers from declaring modules loaded from the cache after the referenced module are taken from
+    the store, modules using them depend on declaring modules, for the related model to be loaded before.
+    """
+
+    def __init__(self, fpath: Optional[str], options: Optional[Options] = None,
+                 config_hash: Optional[str] = None) -> None:
+        self.fpath = fpath
+        self.options = options
+        # hash of the settings configuration the cache was written with, mypy<0.750 only
+        self.config_hash: Optional[str] = None
+        # absolute path of referenced module -> {declaring module: its absolute path}
+        self.declaring_modules: Dict[str, Dict[str, str]] = {}
+        # declaring module -> {model fullname: {related manager name: {'model', 'field', 'kind'}}}
+        self.reverse_relations: Dict[str, Dict[str, Dict[str, Dict[str, str]]]] = {}
+        # modules using related managers -> declaring modules of their related models
+        self.related_managers_users: Dict[str, List[str]] = {}
+        # referenced modules -> {'path', 'source_hashes': {declaring module: hash of its source}}, when they
+        # were analyzed, mypy<0.750 only
+        self.analyzed_modules: Dict[str, Dict[str, Any]] = {}
+        # declaring module -> absolute paths of referenced modules, as recorded in the current build
+        self._recorded: Dict[str, Set[str]] = {}
+        self._source_hashes: Dict[str, Optional[str]] = {}
+        if fpath is not None and os.path.isfile(fpath):
+            try:
+                with open(fpath) as store_file:
+                    data = json.load(store_file)
+                self.declaring_modules = data['declaring_modules']
+                self.reverse_relations = data['reverse_relations']
+                self.related_managers_users = data['related_managers_users']
+                self.analyzed_modules = data['analyzed_modules']
+                self.config_hash = data['config_hash']
+            except (OSError, ValueError, KeyError, TypeError):
+                self.declaring_modules = {}
+                self.reverse_relations = {}
+                self.related_managers_users = {}
+                self.analyzed_modules = {}
+                self.config_hash = None
+        if self.options is not None and fpath is not None:
+            if self.config_hash != config_hash:
+                self.remove_all_cache_meta()
+                self.config_hash = config_hash
+                self.save()
+            elif self.analyzed_modules:
+                self.remove_stale_cache_meta()
+
+    def get_source_hash(self, module_path: str) -> Optional[str]:
+        if module_path not in self._source_hashes:
+            try:
+                with open(module_path, 'rb') as module_file:
+                    self._source_hashes[module_path] = hashlib.md5(module_file.read()).hexdigest()
+            except OSError:
+                self._source_hashes[module_path] = None
+        return self._source_hashes[module_path]
+
+    def get_declaring_modules(self, module_path: str) -> List[str]:
+        declaring_modules = self.declaring_modules.get(os.path.abspath(module_path), {})
+        # modules could be moved or removed since they were recorded
+        return [module_name for module_name, module_path in sorted(declaring_modules.items())
+                if os.path.isfile(module_path)]
+
+    def get_source_hashes(self, module_path: str, declaring_modules: Dict[str, str]) -> Dict[str, str]:
+        # declaring modules of the current build are not recorded yet, when the referenced one is analyzed
+        declaring_modules = {**self.declaring_modules.get(os.path.abspath(module_path), {}), **declaring_modules}
+        source_hashes = {}
+        for module_name, module_path in sorted(declaring_modules.items()):
+            source_hash = self.get_source_hash(module_path)
+            if source_hash is not None:
+                source_hashes[module_name] = source_hash
+        return source_hashes
+
+    def get_reverse_relations(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        declaring_paths = {module_name: module_path for declaring_modules in self.declaring_modules.values()
+                           for module_name, module_path in declaring_modules.items()}
+        reverse_relations: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for module_name, module_relations in sorted(self.reverse_relations.items()):
+            if module_name not in declaring_paths or not os.path.isfile(declaring_paths[module_name]):
+                continue
+            for model_fullname, model_relations in module_relations.items():
+                reverse_relations.setdefault(model_fullname, {}).update(model_relations)
+        return reverse_relations
+
+    def record(self, module_file: MypyFile, referenced_module_files: Iterable[MypyFile],
+               reverse_relations: Dict[str, Dict[str, Dict[str, str]]]) -> None:
+        module_name = module_file.fullname()
+        module_path = os.path.abspath(module_file.path)
+        referenced_paths = {os.path.abspath(referenced.path) for referenced in referenced_module_files
+                            if referenced.path and referenced is not module_file}
+        if self._recorded.get(module_name) == referenced_paths:
+            return None
+        self._recorded[module_name] = referenced_paths
+
+        changed = False
+        for referenced_path, declaring_modules in self.declaring_modules.items():
+            if module_name in declaring_modules and referenced_path not in referenced_paths:
+                del declaring_modules[module_name]
+                changed = True
+        for referenced_path in referenced_paths:
+            declaring_modules = self.declaring_modules.setdefault(referenced_path, {})
+            if declaring_modules.get(module_name) != module_path:
+                declaring_modules[module_name] = module_path
+                changed = True
+        if self.reverse_relations.get(module_name, {}) != reverse_relations:
+            self.reverse_relations[module_name] = reverse_relations
+            changed = True
+        if changed:
+            self.save()
+
+    def record_analyzed(self, module_file: MypyFile, declaring_modules: Dict[str, str]) -> None:
+        if self.options is None or not module_file.path:
+            return None
+        module_record = {'path': module_file.path,
+                         'source_hashes': self.get_source_hashes(module_file.path, declaring_modules)}
+        if self.analyzed_modules.get(module_file.fullname()) != module_record:
+            self.analyzed_modules[module_file.fullname()] = module_record
+            self.save()
+
+    def record_related_manager_use(self, module_name: str, declaring_module: str) -> None:
+        used_modules = self.related_managers_users.setdefault(module_name, [])
+        if declaring_module not in used_modules:
+            used_modules.append(declaring_module)
+            self.save()
+
+    def pop_used_declaring_modules(self, module_name: str) -> List[str]:
+        # recorded again, when the module is checked
+        return self.related_managers_users.pop(module_name, [])
+
+    def remove_stale_cache_meta(self) -> None:
+        assert self.options is not None
+        manager = create_cache_build_manager(self.options)
+        for module_name, module_record in sorted(self.analyzed_modules.items()):
+            if self.get_source_hashes(module_record['path'], {}) == module_record['source_hashes']:
+                continue
+            meta_fname, _, _ = build.get_cache_names(module_name, module_record['path'], manager)
+            try:
+                manager.metastore.remove(meta_fname)
+            except OSError:
+                # not cached, or already removed
+                pass
+            del self.analyzed_modules[module_name]
+        manager.metastore.commit()
+        self.save()
+
+    def remove_all_cache_meta(self) -> None:
+        assert self.options is not None
+        manager = create_cache_build_manager(self.options)
+        for fname in list(manager.metastore.list_all()):
+            if fname.endswith('.meta.json'):
+                manager.metastore.remove(fname)
+        manager.metastore.commit()
+        self.analyzed_modules = {}
+
+    def save(self) -> None:
+        if self.fpath is None:
+            return None
+        self.declaring_modules = {referenced_path: declaring_modules
+                                  for referenced_path, declaring_modules in self.declaring_modules.items()
+                                  if declaring_modules}
+        self.reverse_relations = {module_name: module_relations
+                                  for module_name, module_relations in self.reverse_relations.items()
+                                  if module_relations}
+        try:
+            os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+            # other mypy processes could share the cache directory
+            tmp_fpath = f'{self.fpath}.{os.getpid()}.tmp'
+            with open(tmp_fpath, 'w') as store_file:
+                json.dump({'declaring_modules': self.declaring_modules,
+                           'reverse_relations': self.reverse_relations,
+                           'related_managers_users': self.related_managers_users,
+                           'analyzed_modules': self.analyzed_modules,
+                           'config_hash': self.config_hash},
+                          store_file, indent=1, sort_keys=True)
+            os.replace(tmp_fpath, self.fpath)
+        except OSError:
+            pass
+
+
+class DependencyProvider:
+    """
+    Computes modules which have to be analyzed before a module, but are not imported by it:
+
+    * django.conf needs settings modules, their star imports are followed to find all setting values;
+    * django.contrib.auth needs django.conf for get_user_model();
+    * settings modules need models module of AUTH_USER_MODEL and AppConfig modules of INSTALLED_APPS,
+      if app label of AUTH_USER_MODEL differs from app package name, AppConfig module with that label needs
+      models module of its app;
+    * models need models modules referenced by string in ForeignKey('app_label.Model') and friends,
+      or settings module, if app label is not a package name;
+    * modules using related managers need modules declaring their related fields, as recorded
+      in previous incremental runs.
+
+    Dependencies are reported through Plugin.get_additional_deps(), so mypy schedules and caches them
+    as ordinary imports.
+    """
+
+    def __init__(self, settings_modules: List[str], search_paths: List[str],
+                 model_schema: Optional[ModelSchema] = None,
+                 related_modules: Optional[RelatedModulesStore] = None) -> None:
+        self.settings_modules = settings_modules
+        self.search_paths = search_paths
+        # models summarized in it are not loaded for "app_label.Model" references
+        self.model_schema = model_schema
+        # modules with related fields to models of a module and their users, from previous incremental runs
+        self.related_modules = related_modules or RelatedModulesStore(None)
+        # settings modules with all modules they star-import, in order of discovery
+        self.settings_closure: Dict[str, None] = dict.fromkeys(settings_modules)
+        # lowercased app label -> app module, from INSTALLED_APPS and AppConfig classes parsed so far
+        self.app_modules: Dict[str, str] = {}
+        # lowercased app labels of AUTH_USER_MODEL values without "<app_label>.models" module
+        self.user_model_app_labels: Set[str] = set()
+        self._module_exists_cache: Dict[str, bool] = {}
+
+    def module_exists(self, module_name: str) -> bool:
+        if module_name not in self._module_exists_cache:
+            module_path = os.path.join(*module_name.split('.'))
+            candidates = [module_path + '.py', module_path + '.pyi',
+                          os.path.join(module_path, '__init__.py'),
+                          os.path.join(module_path, '__init__.pyi')]
+            self._module_exists_cache[module_name] = any(os.path.isfile(os.path.join(search_path, candidate))
+                                                         for search_path in self.search_paths
+                                                         for candidate in candidates)
+        return self._module_exists_cache[module_name]
+
+    def get_settings_dependencies(self, module_file: MypyFile) -> List[str]:
+        dependencies = []
+        for star_import_module in iter_over_import_star_modules(module_file):
+            self.settings_closure[star_import_module] = None
+            dependencies.append(star_import_module)
+
+        for lvalue, rvalue in helpers.iter_over_assignments(module_file):
+            if (isinstance(lvalue, NameExpr) and lvalue.name == 'AUTH_USER_MODEL'
+                    and isinstance(rvalue, StrExpr)):
+                models_module = get_models_module_from_model_string(rvalue.value)
+                if models_module is not None and self.module_exists(models_module):
+                    dependencies.append(models_module)
+                elif models_module is not None:
+                    self.user_model_app_labels.add(rvalue.value.rpartition('.')[0].lower())
+
+            if (isinstance(lvalue, NameExpr) and lvalue.name == 'INSTALLED_APPS'
+                    and isinstance(rvalue, (ListExpr, TupleExpr))):
+                for app_entry in rvalue.items:
+                    if not isinstance(app_entry, StrExpr):
+                        continue
+                    # 'project.myapp', labelled 'myapp' unless its AppConfig says otherwise
+                    if self.module_exists(app_entry.value + '.models'):
+                        self.app_modules.setdefault(app_entry.value.rpartition('.')[2].lower(), app_entry.value)
+                    # AppConfig classes with app labels, 'myapp.apps.MyAppConfig' or myapp/apps.py
+                    for app_config_module in [app_entry.value.rpartition('.')[0], app_entry.value + '.apps']:
+                        if app_config_module and self.module_exists(app_config_module):
+                            dependencies.append(app_config_module)
+
+        for app_label in self.user_model_app_labels:
+            if app_label in self.app_modules:
+                dependencies.append(self.app_modules[app_label] + '.models')
+        return dependencies
+
+    def get_app_config_dependencies(self, module_file: MypyFile) -> List[str]:
+        dependencies = []
+        for defn in iter_over_classdefs(module_file):
+            if not is_app_config_class(defn, module_file):
+                continue
+            app_config = get_str_assignments(defn)
+            if 'name' not in app_config:
+                continue
+            app_label = app_config.get('label', app_config['name'].rpartition('.')[2]).lower()
+            self.app_modules[app_label] = app_config['name']
+            # AppConfig modules are parsed after the settings module, which requires them
+            if app_label in self.user_model_app_labels and self.module_exists(app_config['name'] + '.models'):
+                dependencies.append(app_config['name'] + '.models')
+        return dependencies
+
+    def get_related_models_dependencies(self, module_file: MypyFile) -> List[str]:
+        dependencies: Set[str] = set()
+        for defn in iter_over_classdefs(module_file):
+            for _, rvalue in iter_call_assignments(defn):
+                if not is_related_field(rvalue, module_file):
+                    continue
+                to_expr = extract_to_expr(rvalue)
+                if not isinstance(to_expr, StrExpr):
+                    continue
+                models_module = get_models_module_from_model_string(to_expr.value)
+                if models_module is None:
+                    continue
+                if self.model_schema is not None and self.model_schema.has_model(to_expr.value):
+                    continue
+                if self.module_exists(models_module):
+                    dependencies.add(models_module)
+                elif len(self.settings_modules) > 1:
+                    # app label differs from app package name, it's resolved from INSTALLED_APPS
+                    dependencies.add(self.settings_modules[-1])
+        return sorted(dependencies)
+
+    def get_dependencies(self, module_file: MypyFile) -> List[str]:
+        module_name = module_file.fullname()
+        if module_name == 'django.conf':
+            return list(self.settings_closure)
+        if module_name == 'django.contrib.auth':
+            # get_user_model() is resolved from AUTH_USER_MODEL setting
+            return ['django.conf']
+
+        dependencies = []
+        if module_name in self.settings_closure:
+            dependencies.extend(self.get_settings_dependencies(module_file))
+        dependencies.extend(self.get_app_config_dependencies(module_file))
+        dependencies.extend(self.get_related_models_dependencies(module_file))
+        return [dependency for dependency in dependencies if dependency != module_name]
+
+    def get_related_managers_dependencies(self, module_file: MypyFile) -> List[str]:
+        # related models could be declared outside of the build
+        return [dependency for dependency in self.related_modules.pop_used_declaring_modules(module_file.fullname())
+                if dependency != module_file.fullname() and self.module_exists(dependency)]
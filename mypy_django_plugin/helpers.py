@@ -1,12 +1,15 @@
 import typing
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, Optional
 
 from mypy.checker import TypeChecker
 from mypy.nodes import AssignmentStmt, ClassDef, Expression, ImportedName, Lvalue, MypyFile, NameExpr, SymbolNode, \
-    TypeInfo
+    TypeInfo, Var
 from mypy.plugin import FunctionContext
 from mypy.types import AnyType, Instance, NoneTyp, Type, TypeOfAny, TypeVarType, UnionType
 
+if TYPE_CHECKING:
+    from mypy_django_plugin.transformers.settings import ImportStarClosure
+
 MODEL_CLASS_FULLNAME = 'django.db.models.base.Model'
 FIELD_FULLNAME = 'django.db.models.fields.Field'
 CHAR_FIELD_FULLNAME = 'django.db.models.fields.CharField'
@@ -18,6 +21,8 @@ ONETOONE_FIELD_FULLNAME = 'django.db.models.fields.related.OneToOneField'
 MANYTOMANY_FIELD_FULLNAME = 'django.db.models.fields.related.ManyToManyField'
 DUMMY_SETTINGS_BASE_CLASS = 'django.conf._DjangoConfLazyObject'
 
+RELATED_FIELD_ID_SUFFIX = '_id'
+
 QUERYSET_CLASS_FULLNAME = 'django.db.models.query.QuerySet'
 BASE_MANAGER_CLASS_FULLNAME = 'django.db.models.manager.BaseManager'
 MANAGER_CLASS_FULLNAME = 'django.db.models.manager.Manager'
@@ -63,18 +68,6 @@ class SelfReference(ValueError):
     pass
 
 
-def get_model_fullname_from_string(model_string: str,
-                                   all_modules: Dict[str, MypyFile]) -> Optional[str]:
-    if model_string == 'self':
-        raise SelfReference()
-
-    if '.' not in model_string:
-        raise SameFileModel(model_string)
-
-    app_name, model_name = model_string.split('.')
-    return get_model_fullname(app_name, model_name, all_modules)
-
-
 def lookup_fully_qualified_generic(name: str, all_modules: Dict[str, MypyFile]) -> Optional[SymbolNode]:
     if '.' not in name:
         return None
@@ -154,26 +147,83 @@ def get_argument_type_by_name(ctx: FunctionContext, name: str) -> Optional[Type]
     return arg_types[0]
 
 
-def get_setting_expr(api: TypeChecker, setting_name: str) -> Optional[Expression]:
+class SettingsIndex:
+    """
+    Final assignment expressions of settings, by setting name.
+
+    Settings module is taken from django.conf.settings, value assigned there is looked up in modules it
+    star-imports, in override order, if the module itself does not assign the setting. Assignments of every
+    module are scanned at most once per module tree.
+    """
+
+    def __init__(self, import_star_closure: 'ImportStarClosure') -> None:
+        self.import_star_closure = import_star_closure
+        # setting name -> (settings module tree, defining module tree, value expression)
+        self.setting_exprs: Dict[str, typing.Tuple[MypyFile, MypyFile, Optional[Expression]]] = {}
+        # module name -> (module tree, {setting name: value expression})
+        self.module_assignments: Dict[str, typing.Tuple[MypyFile, Dict[str, Expression]]] = {}
+
+    def get_module_assignments(self, module_file: MypyFile) -> Dict[str, Expression]:
+        cached = self.module_assignments.get(module_file.fullname())
+        if cached is None or cached[0] is not module_file:
+            assignments = {}
+            for name_expr, value_expr in iter_over_assignments(module_file):
+                if isinstance(name_expr, NameExpr):
+                    # later assignment overrides the earlier one
+                    assignments[name_expr.name] = value_expr
+            cached = (module_file, assignments)
+            self.module_assignments[module_file.fullname()] = cached
+        return cached[1]
+
+    def get_setting_expr(self, api: TypeChecker, setting_name: str) -> Optional[Expression]:
+        cached = self.setting_exprs.get(setting_name)
+        if cached is not None:
+            module_file, defining_module_file, value_expr = cached
+            # settings modules could be replaced with fresh trees (cache load, daemon update)
+            if (api.modules.get(module_file.fullname()) is module_file
+                    and api.modules.get(defining_module_file.fullname()) is defining_module_file):
+                return value_expr
+
+        module_file = get_setting_module(api, setting_name)
+        if module_file is None:
+            return None
+        defining_module_file = self.get_defining_module(api, module_file, setting_name)
+        value_expr = self.get_module_assignments(defining_module_file).get(setting_name)
+        self.setting_exprs[setting_name] = (module_file, defining_module_file, value_expr)
+        return value_expr
+
+    def get_defining_module(self, api: TypeChecker, module_file: MypyFile, setting_name: str) -> MypyFile:
+        if setting_name in self.get_module_assignments(module_file):
+            return module_file
+
+        # every module of the closure overrides the ones before it
+        for star_import_module in reversed(self.import_star_closure.get_closure(api.modules,
+                                                                                module_file.fullname())):
+            star_import_file = api.modules.get(star_import_module)
+            if star_import_file is not None and setting_name in self.get_module_assignments(star_import_file):
+                return star_import_file
+
+        # imported by name, from .base import SETTING
+        sym = module_file.names.get(setting_name)
+        if sym is not None and isinstance(sym.node, Var):
+            imported_from = api.modules.get(sym.node.fullname().rpartition('.')[0])
+            if imported_from is not None:
+                return imported_from
+        return module_file
+
+
+def get_setting_module(api: TypeChecker, setting_name: str) -> Optional[MypyFile]:
     try:
         settings_sym = api.modules['django.conf'].names['settings']
     except KeyError:
         return None
 
     settings_type: TypeInfo = settings_sym.type.type
-    auth_user_model_sym = settings_type.get(setting_name)
-    if not auth_user_model_sym:
-        return None
-
-    module, _, name = auth_user_model_sym.fullname.rpartition('.')
-    if module not in api.modules:
+    # filled for every setting, also when settings are not copied into LazySettings (lazy_settings = True)
+    module = settings_type.metadata.get('django', {}).get('settings', {}).get(setting_name)
+    if module is None:
         return None
-
-    module_file = api.modules.get(module)
-    for name_expr, value_expr in iter_over_assignments(module_file):
-        if isinstance(name_expr, NameExpr) and name_expr.name == setting_name:
-            return value_expr
-    return None
+    return api.modules.get(module)
 
 
 def iter_over_assignments(
@@ -217,6 +267,12 @@ def get_django_metadata(model: TypeInfo) -> Dict[str, typing.Any]:
     return model.metadata.setdefault('django', {})
 
 
+def get_reverse_relations_attr(model_name: str) -> str:
+    # attribute of model classes listing related managers they add to other models, for fine-grained mode,
+    # private (mangled) name keeps it out of attributes of the model
+    return '_' + model_name.lstrip('_') + '__reverse_relations'
+
+
 def get_related_field_primary_key_names(base_model: TypeInfo) -> typing.List[str]:
     django_metadata = get_django_metadata(base_model)
     return django_metadata.setdefault('related_field_primary_keys', [])
@@ -226,23 +282,69 @@ def get_fields_metadata(model: TypeInfo) -> Dict[str, typing.Any]:
     return get_django_metadata(model).setdefault('fields', {})
 
 
-def extract_explicit_set_type_of_model_primary_key(model: TypeInfo) -> Optional[Type]:
+def get_field_metadata(model: TypeInfo, field_name: str) -> Dict[str, typing.Any]:
+    """
+    Properties recorded for the field (null, blank, choices, ...), inherited fields are copied into
+    metadata of the model, when it's semantically analyzed.
+    """
+    return model.metadata.get('django', {}).get('fields', {}).get(field_name, {})
+
+
+def get_primary_key_field_name(model: TypeInfo) -> Optional[str]:
+    """
+    Name of the field with primary_key=True, recorded during semantic analysis, could be inherited.
+    """
+    return model.metadata.get('django', {}).get('primary_key')
+
+
+def get_private_descriptor_type(type_info: TypeInfo, private_field_name: str, is_nullable: bool) -> Type:
+    node = type_info.get(private_field_name).node
+    if isinstance(node, Var):
+        descriptor_type = node.type
+        if is_nullable:
+            descriptor_type = make_optional(descriptor_type)
+        return descriptor_type
+    return AnyType(TypeOfAny.unannotated)
+
+
+def get_primary_key_field_type(model: TypeInfo, api: TypeChecker) -> Optional[Instance]:
+    primary_key_field_name = get_primary_key_field_name(model)
+    if primary_key_field_name is None:
+        return None
+
+    field_class_fullname = model.metadata['django'].get('primary_key_class')
+    if field_class_fullname is None:
+        # related field as primary key, referred model is known after the field type is inferred
+        sym = model.get(primary_key_field_name)
+        if sym is None or not isinstance(sym.type, Instance):
+            return None
+        return sym.type
+
+    # same descriptor types as set for the field instance, available before the field type is inferred
+    field_info = api.lookup_typeinfo(field_class_fullname)
+    field_metadata = get_field_metadata(model, primary_key_field_name)
+    is_nullable = field_metadata.get('null', False)
+    if not is_nullable and field_info.has_base(CHAR_FIELD_FULLNAME):
+        is_nullable = field_metadata.get('blank', False)
+    return Instance(field_info, [get_private_descriptor_type(field_info, '_pyi_private_set_type', is_nullable),
+                                 get_private_descriptor_type(field_info, '_pyi_private_get_type', is_nullable)])
+
+
+def extract_explicit_set_type_of_model_primary_key(model: TypeInfo, api: TypeChecker) -> Optional[Type]:
     """
     If field with primary_key=True is set on the model, extract its __set__ type.
     """
-    for field_name, props in get_fields_metadata(model).items():
-        is_primary_key = props.get('primary_key', False)
-        if is_primary_key:
-            return extract_field_setter_type(model.names[field_name].type)
-    return None
+    primary_key_field_type = get_primary_key_field_type(model, api)
+    if primary_key_field_type is None:
+        return None
+    return extract_field_setter_type(primary_key_field_type)
 
 
-def extract_primary_key_type_for_get(model: TypeInfo) -> Optional[Type]:
-    for field_name, props in get_fields_metadata(model).items():
-        is_primary_key = props.get('primary_key', False)
-        if is_primary_key:
-            return extract_field_getter_type(model.names[field_name].type)
-    return None
+def extract_primary_key_type_for_get(model: TypeInfo, api: TypeChecker) -> Optional[Type]:
+    primary_key_field_type = get_primary_key_field_type(model, api)
+    if primary_key_field_type is None:
+        return None
+    return extract_field_getter_type(primary_key_field_type)
 
 
 def make_optional(typ: Type):
@@ -0,0 +1,120 @@
+"""
+Snapshot of django.apps.apps registry, taken by running django.setup() in a subprocess.
+
+Snapshot has the same format as model schema summary (see schema.py): app labels and reverse relations,
+including the ones declared in ways static analysis doesn't recognize. It also lists project source files
+imported by django.setup() with a hash of their contents, and is reused until one of them changes.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from typing import Any, Dict, Optional
+
+from mypy_django_plugin.schema import MODEL_SCHEMA_VERSION
+
+TAKE_SNAPSHOT = textwrap.dedent('''
+    import json, os, sys
+    import django
+    from django.apps import apps
+    from django.conf import settings
+
+    def get_fullname(cls):
+        return cls.__module__ + '.' + cls.__qualname__
+
+    def get_relation_kind(field):
+        if field.many_to_many:
+            return 'ManyToManyField'
+        if field.one_to_one:
+            return 'OneToOneField'
+        return 'ForeignKey'
+
+    django.setup()
+    # settings, apps and models modules of the project
+    sources = [module.__file__ for module in list(sys.modules.values())
+               if getattr(module, '__file__', None) and module.__file__.startswith(os.getcwd() + os.sep)]
+    models = {}
+    for model in apps.get_models():
+        reverse_relations = {}
+        for field in model._meta.get_fields(include_hidden=False):
+            if field.auto_created and not field.concrete:
+                accessor_name = field.get_accessor_name()
+                if accessor_name:
+                    reverse_relations[accessor_name] = {'model': get_fullname(field.related_model),
+                                                        'field': field.field.name,
+                                                        'kind': get_relation_kind(field)}
+        models[get_fullname(model)] = {
+            'app_label': model._meta.app_label,
+            'reverse_relations': reverse_relations,
+        }
+    print(json.dumps({'models': models, 'sources': sorted(sources)}))
+''')
+
+
+def get_sources_hash(source_fpaths: Any) -> str:
+    sources_hash = hashlib.sha1()
+    for fpath in sorted(source_fpaths):
+        sources_hash.update(fpath.encode())
+        if os.path.exists(fpath):
+            with open(fpath, 'rb') as source_file:
+                sources_hash.update(source_file.read())
+    return sources_hash.hexdigest()
+
+
+def load_cached_snapshot(snapshot_fpath: str, settings_module: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(snapshot_fpath):
+        return None
+    try:
+        with open(snapshot_fpath) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        # corrupted or unreadable, taken again
+        return None
+    if (not isinstance(snapshot, dict)
+            or snapshot.get('version') != MODEL_SCHEMA_VERSION
+            or snapshot.get('settings_module') != settings_module
+            or snapshot.get('sources_hash') != get_sources_hash(snapshot.get('sources', []))):
+        return None
+    return snapshot
+
+
+def take_snapshot(settings_module: str) -> Dict[str, Any]:
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    # settings and apps are importable from the current directory, as for manage.py
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.getcwd(), env.get('PYTHONPATH')]))
+    output = subprocess.run([sys.executable, '-c', TAKE_SNAPSHOT], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    snapshot = json.loads(output.stdout.decode().splitlines()[-1])
+    snapshot['version'] = MODEL_SCHEMA_VERSION
+    snapshot['settings_module'] = settings_module
+    snapshot['sources_hash'] = get_sources_hash(snapshot['sources'])
+    return snapshot
+
+
+def get_apps_snapshot(snapshot_fpath: str, settings_module: str) -> Optional[Dict[str, Any]]:
+    """Cached snapshot, if it's up to date, otherwise fresh one. None, if django.setup() fails."""
+    snapshot = load_cached_snapshot(snapshot_fpath, settings_module)
+    if snapshot is not None:
+        return snapshot
+
+    try:
+        snapshot = take_snapshot(settings_module)
+    except subprocess.CalledProcessError as exc:
+        print(f'mypy_django_plugin: cannot introspect Django apps, falling back to static analysis\n'
+              f'{exc.stderr.decode()}', file=sys.stderr)
+        return None
+    except (ValueError, IndexError, OSError) as exc:
+        # no output or not a snapshot printed, python could not be started
+        print(f'mypy_django_plugin: cannot introspect Django apps, falling back to static analysis\n'
+              f'{exc!r}', file=sys.stderr)
+        return None
+
+    try:
+        with open(snapshot_fpath, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file, indent=1, sort_keys=True)
+    except OSError:
+        # taken again by the next run
+        pass
+    return snapshot
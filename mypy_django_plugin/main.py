@@ -1,36 +1,61 @@
+import hashlib
+import json
 import os
-from typing import Callable, Dict, Optional, Union, cast
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union, cast
 
 from mypy.checker import TypeChecker
-from mypy.nodes import MemberExpr, TypeInfo
+from mypy.nodes import MemberExpr, MypyFile, TypeInfo
 from mypy.options import Options
 from mypy.plugin import AttributeContext, ClassDefContext, FunctionContext, MethodContext, Plugin
-from mypy.types import AnyType, Instance, Type, TypeOfAny, TypeType, UnionType
-from mypy_django_plugin import helpers, monkeypatch
+from mypy.semanal import SemanticAnalyzerPass2
+from mypy.types import AnyType, Instance, Type, TypeOfAny, TypeType, UninhabitedType, UnionType
+from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import AppsRegistry
 from mypy_django_plugin.config import Config
+from mypy_django_plugin.dependencies import DependencyProvider, RelatedModulesStore
+from mypy_django_plugin.introspection import get_apps_snapshot
+from mypy_django_plugin.profiling import HooksProfiler
+from mypy_django_plugin.schema import ModelSchema, ModelSchemaExport
 from mypy_django_plugin.transformers import fields, init_create
 from mypy_django_plugin.transformers.migrations import determine_model_cls_from_string_for_migrations, \
     get_string_value_from_expr
-from mypy_django_plugin.transformers.models import process_model_class
-from mypy_django_plugin.transformers.settings import AddSettingValuesToDjangoConfObject, get_settings_metadata
-
-
-def transform_model_class(ctx: ClassDefContext) -> None:
-    try:
-        sym = ctx.api.lookup_fully_qualified(helpers.MODEL_CLASS_FULLNAME)
-    except KeyError:
-        # models.Model is not loaded, skip metadata model write
-        pass
-    else:
-        if sym is not None and isinstance(sym.node, TypeInfo):
-            sym.node.metadata['django']['model_bases'][ctx.cls.fullname] = 1
-    process_model_class(ctx)
-
-
-def transform_manager_class(ctx: ClassDefContext) -> None:
-    sym = ctx.api.lookup_fully_qualified_or_none(helpers.MANAGER_CLASS_FULLNAME)
-    if sym is not None and isinstance(sym.node, TypeInfo):
-        sym.node.metadata['django']['manager_bases'][ctx.cls.fullname] = 1
+from mypy_django_plugin.transformers.models import ManagersIndex, RelatedFieldsIndex, process_model_class
+from mypy_django_plugin.transformers.settings import AddSettingValuesToDjangoConfObject, ExtractLazySettingType, \
+    ImportStarClosure, get_settings_metadata
+
+
+def transform_model_class(ctx: ClassDefContext, model_bases: Set[str],
+                          related_fields_index: RelatedFieldsIndex, managers_index: ManagersIndex,
+                          related_modules: RelatedModulesStore,
+                          model_schema_export: Optional[ModelSchemaExport]) -> None:
+    model_bases.add(ctx.cls.fullname)
+    api = cast(SemanticAnalyzerPass2, ctx.api)
+    related_fields_index.apps_registry.register_model(ctx.cls.info, all_modules=api.modules)
+    if related_fields_index.runtime_reverse_relations is None and api.cur_mod_node.path:
+        # cached modules parsed again when their dependencies change don't go through get_additional_deps()
+        for module_name in related_modules.get_declaring_modules(api.cur_mod_node.path):
+            if module_name in api.modules:
+                related_fields_index.add_module(api.modules[module_name])
+    process_model_class(ctx, related_fields_index, managers_index)
+
+    if related_fields_index.runtime_reverse_relations is None:
+        # cache of referenced modules is invalidated, when the current one changes in the next incremental runs
+        referenced_modules = {target_fullname.rpartition('.')[0]
+                              for target_fullname in related_fields_index.targets_by_module.get(api.cur_mod_id, ())}
+        related_modules.record(api.cur_mod_node, [api.modules[module_name] for module_name in referenced_modules
+                                                  if module_name in api.modules],
+                               reverse_relations=related_fields_index.get_reverse_relations(api.cur_mod_id))
+        related_modules.record_analyzed(api.cur_mod_node,
+                                        related_fields_index.get_declaring_module_paths(api.cur_mod_id,
+                                                                                        all_modules=api.modules))
+
+    if model_schema_export is not None:
+        model_schema_export.update_model(ctx.cls.info, related_fields_index.apps_registry)
+
+
+def transform_manager_class(ctx: ClassDefContext, manager_bases: Set[str]) -> None:
+    manager_bases.add(ctx.cls.fullname)
 
 
 def determine_proper_manager_type(ctx: FunctionContext) -> Type:
@@ -45,18 +70,53 @@ def determine_proper_manager_type(ctx: FunctionContext) -> Type:
     if not isinstance(ret, Instance):
         return ret
 
+    model_instance = Instance(outer_model_info, [])
+    if ret.type.type_vars:
+        # generic manager class (models.Manager()), filled with the model, the class is shared by all models
+        if len(ret.type.type_vars) == 1 and all(isinstance(arg, (AnyType, UninhabitedType)) for arg in ret.args):
+            return Instance(ret.type, [model_instance])
+        return ret
+
     for i, base in enumerate(ret.type.bases):
         if base.type.fullname() in {helpers.MANAGER_CLASS_FULLNAME,
                                     helpers.RELATED_MANAGER_CLASS_FULLNAME,
                                     helpers.BASE_MANAGER_CLASS_FULLNAME}:
-            ret.type.bases[i] = Instance(base.type, [Instance(outer_model_info, [])])
+            # manager class of the project with unparametrized base (class MyManager(models.Manager))
+            if all(isinstance(arg, AnyType) for arg in base.args):
+                ret.type.bases[i] = Instance(base.type, [model_instance])
             return ret
     return ret
 
 
-def return_user_model_hook(ctx: FunctionContext) -> Type:
+def return_related_model_type(ctx: AttributeContext, related_modules: RelatedModulesStore) -> Type:
+    # related managers added by related fields from other modules are typed with Any in place of the model
+    if not isinstance(ctx.type, Instance) or not isinstance(ctx.context, MemberExpr):
+        return ctx.default_attr_type
+    for base in ctx.type.type.mro:
+        relation = base.metadata.get('django', {}).get('reverse_relations', {}).get(ctx.context.name)
+        if relation is not None:
+            break
+    else:
+        return ctx.default_attr_type
+
     api = cast(TypeChecker, ctx.api)
-    setting_expr = helpers.get_setting_expr(api, 'AUTH_USER_MODEL')
+    related_module, _, _ = relation['model'].rpartition('.')
+    if api.tree.fullname() not in {base.module_name, related_module}:
+        # related model is loaded before the current module is checked, in the next incremental runs
+        related_modules.record_related_manager_use(api.tree.fullname(), related_module)
+
+    related_model_info = helpers.lookup_fully_qualified_generic(relation['model'], all_modules=api.modules)
+    if not isinstance(related_model_info, TypeInfo):
+        return ctx.default_attr_type
+    if relation['kind'] in {'ForeignKey', 'ManyToManyField'}:
+        return api.named_generic_type(helpers.RELATED_MANAGER_CLASS_FULLNAME, [Instance(related_model_info, [])])
+    return Instance(related_model_info, [])
+
+
+def return_user_model_hook(ctx: FunctionContext, settings_index: helpers.SettingsIndex,
+                           apps_registry: AppsRegistry) -> Type:
+    api = cast(TypeChecker, ctx.api)
+    setting_expr = settings_index.get_setting_expr(api, 'AUTH_USER_MODEL')
     if setting_expr is None:
         return ctx.default_return_type
 
@@ -68,8 +128,8 @@ def return_user_model_hook(ctx: FunctionContext) -> Type:
     if app_label is None:
         return ctx.default_return_type
 
-    model_fullname = helpers.get_model_fullname(app_label, model_class_name,
-                                                all_modules=api.modules)
+    model_fullname = apps_registry.get_model_fullname(app_label, model_class_name,
+                                                      all_modules=api.modules)
     if model_fullname is None:
         api.fail(f'"{app_label}.{model_class_name}" model class is not imported so far. Try to import it '
                  f'(under if TYPE_CHECKING) at the beginning of the current file',
@@ -101,7 +161,7 @@ def extract_and_return_primary_key_of_bound_related_field_parameter(ctx: Attribu
     if not isinstance(ctx.type, Instance) or not ctx.type.type.has_base(helpers.MODEL_CLASS_FULLNAME):
         return ctx.default_attr_type
 
-    field_name = ctx.context.name.split('_')[0]
+    field_name = ctx.context.name[:-len(helpers.RELATED_FIELD_ID_SUFFIX)]
     sym = ctx.type.type.get(field_name)
     if sym and isinstance(sym.type, Instance) and len(sym.type.args) > 0:
         referred_to = sym.type.args[1]
@@ -112,11 +172,11 @@ def extract_and_return_primary_key_of_bound_related_field_parameter(ctx: Attribu
         if model_type is None:
             return AnyType(TypeOfAny.implementation_artifact)
 
-        primary_key_type = helpers.extract_primary_key_type_for_get(model_type)
+        primary_key_type = helpers.extract_primary_key_type_for_get(model_type, cast(TypeChecker, ctx.api))
         if primary_key_type:
             return primary_key_type
 
-    is_nullable = helpers.get_fields_metadata(ctx.type.type).get(field_name, {}).get('null', False)
+    is_nullable = helpers.get_field_metadata(ctx.type.type, field_name).get('null', False)
     if is_nullable:
         return helpers.make_optional(ctx.default_attr_type)
 
@@ -152,109 +212,300 @@ class DjangoPlugin(Plugin):
     def __init__(self, options: Options) -> None:
         super().__init__(options)
 
-        monkeypatch.restore_original_load_graph()
-        monkeypatch.restore_original_dependencies_handling()
-
-        config_fpath = os.environ.get('MYPY_DJANGO_CONFIG', 'mypy_django.ini')
-        if config_fpath and os.path.exists(config_fpath):
-            self.config = Config.from_config_file(config_fpath)
-            self.django_settings_module = self.config.django_settings_module
+        self.config = Config.from_environment()
+        self.django_settings_module = self.config.django_settings_module
+        self.settings_modules = self.config.get_settings_modules()
+
+        # summary of models exported by a full run, replaces analysis of models referenced only by strings
+        self.model_schema: Optional[ModelSchema] = None
+        if self.config.model_schema:
+            self.model_schema = ModelSchema.from_file(self.config.model_schema)
+
+        search_paths = [os.getcwd(), *self.options.mypy_path]
+        if 'MYPYPATH' in os.environ:
+            search_paths.extend(os.environ['MYPYPATH'].split(os.pathsep))
+        related_modules_fpath = None
+        if self.options.incremental and self.options.cache_dir != os.devnull:
+            python_version_dir = '.'.join(str(part) for part in self.options.python_version)
+            related_modules_fpath = os.path.join(self.options.cache_dir, python_version_dir,
+                                                 'django-related-modules.json')
+
+        if hasattr(Plugin, 'report_config_data'):
+            self.related_modules = RelatedModulesStore(related_modules_fpath)
         else:
-            self.config = Config()
-            self.django_settings_module = None
-
-        if 'DJANGO_SETTINGS_MODULE' in os.environ:
-            self.django_settings_module = os.environ['DJANGO_SETTINGS_MODULE']
-
-        settings_modules = ['django.conf.global_settings']
-        if self.django_settings_module:
-            settings_modules.append(self.django_settings_module)
+            # mypy<0.750 has no report_config_data(), cache metadata of models modules which miss dependencies
+            # on modules declaring related fields to them, or of all modules, when the settings configuration
+            # changes, is removed by the plugin
+            config_hash = hashlib.md5(json.dumps(self.config.get_settings_config_data(),
+                                                 sort_keys=True).encode()).hexdigest()
+            self.related_modules = RelatedModulesStore(related_modules_fpath, options=self.options,
+                                                       config_hash=config_hash)
+
+        self.dependency_provider = DependencyProvider(self.settings_modules, search_paths=search_paths,
+                                                      model_schema=self.model_schema,
+                                                      related_modules=self.related_modules)
+
+        # classes processed by base class hooks in the current build, kept out of TypeInfo.metadata
+        # to not make cache of django.db.models depend on the order modules are analyzed in
+        self.model_bases: Set[str] = {helpers.MODEL_CLASS_FULLNAME}
+        self.manager_bases: Set[str] = {helpers.MANAGER_CLASS_FULLNAME}
+
+        # settings modules star-imported by the settings module, for django.conf.settings
+        self.import_star_closure = ImportStarClosure()
+        # model classes by "app_label.ModelName" strings
+        self.apps_registry = AppsRegistry(self.settings_modules, self.import_star_closure)
+        # reverse relations of all models in the build, filled lazily during semantic analysis
+        self.related_fields_index = RelatedFieldsIndex(self.apps_registry)
+        self.related_fields_index.cached_reverse_relations = self.related_modules.get_reverse_relations()
+        if self.model_schema is not None:
+            self.model_schema.register_models(self.apps_registry)
+            self.related_fields_index.external_reverse_relations = {
+                model_fullname: model_schema['reverse_relations']
+                for model_fullname, model_schema in self.model_schema.models.items()
+            }
+        # opt-in, app registry of the running Django project instead of scanning modules for related fields
+        if self.config.apps_snapshot and self.django_settings_module:
+            apps_snapshot = get_apps_snapshot(self.config.apps_snapshot, self.django_settings_module)
+            if apps_snapshot is not None:
+                ModelSchema(apps_snapshot['models']).register_models(self.apps_registry)
+                self.related_fields_index.runtime_reverse_relations = {
+                    model_fullname: model_snapshot['reverse_relations']
+                    for model_fullname, model_snapshot in apps_snapshot['models'].items()
+                }
+        # managers declared in bodies of model classes and their bases
+        self.managers_index = ManagersIndex()
+        # field names by their instantiation expressions, for every model class body
+        self.field_calls_index = fields.FieldCallsIndex()
+        # constructor signatures of models, checked in Model(...) and Manager.create(...)
+        self.expected_types_cache = init_create.ExpectedTypesCache()
+        # final value expressions of settings, for hooks depending on setting values
+        self.settings_index = helpers.SettingsIndex(self.import_star_closure)
+
+        self._metadata_cache: Dict[str, Tuple[Optional[MypyFile], Dict[str, Any]]] = {}
+        self._hooks_cache: Dict[Tuple[str, str], Optional[Callable[..., Any]]] = {}
+        self._hooks_cache_version: Tuple[int, int] = (0, 0)
+        self._setting_type_hooks: Dict[str, ExtractSettingType] = {}
+        self._lazy_setting_type_hook = ExtractLazySettingType(self.config.ignore_missing_settings)
+        self._related_model_type_hook = partial(return_related_model_type, related_modules=self.related_modules)
+        self._profiled_attribute_hooks: Dict[Callable[..., Any], Callable[..., Any]] = {}
+        self._hooks_cache_hits = 0
+        self._hooks_cache_misses = 0
+
+        self.model_schema_export: Optional[ModelSchemaExport] = None
+        if self.config.model_schema_export:
+            self.model_schema_export = ModelSchemaExport(self.config.model_schema_export)
+
+        # opt-in, MYPY_DJANGO_PROFILE overrides hooks_profile_report from config file
+        profile_report_path = os.environ.get('MYPY_DJANGO_PROFILE', self.config.hooks_profile_report)
+        self.profiler: Optional[HooksProfiler] = None
+        if profile_report_path:
+            self.profiler = HooksProfiler(profile_report_path)
+            self.profiler.register_cache('hooks', lambda: (self._hooks_cache_hits, self._hooks_cache_misses))
+            self.profiler.register_cache('field_calls',
+                                         lambda: (self.field_calls_index.hits, self.field_calls_index.misses))
+            self.profiler.register_cache('managers',
+                                         lambda: (self.managers_index.hits, self.managers_index.misses))
+            self.profiler.register_cache('expected_types',
+                                         lambda: (self.expected_types_cache.hits, self.expected_types_cache.misses))
+
+    def set_modules(self, modules: Dict[str, MypyFile]) -> None:
+        super().set_modules(modules)
+        # new build, drop everything resolved for the previous one
+        self.model_bases = {helpers.MODEL_CLASS_FULLNAME}
+        self.manager_bases = {helpers.MANAGER_CLASS_FULLNAME}
+        self._metadata_cache.clear()
+        self._hooks_cache.clear()
+        self._hooks_cache_version = (0, 0)
+
+    def get_additional_deps(self, file: MypyFile) -> List[Tuple[int, str, int]]:
+        if self.related_fields_index.runtime_reverse_relations is None:
+            self.related_fields_index.add_module(file)
+        dependencies = [(10, dependency, -1) for dependency in self.dependency_provider.get_dependencies(file)]
+        dependencies.extend((20, dependency, -1)
+                            for dependency in self.dependency_provider.get_related_managers_dependencies(file))
+        return dependencies
+
+    def report_config_data(self, ctx: Any) -> Any:
+        # called by mypy>=0.750 only, invalidates cached django.conf when settings configuration changes
+        if ctx.id == 'django.conf':
+            return self.config.get_settings_config_data()
+        # and cached models modules, when modules declaring related fields to them are changed or added
+        if ctx.path:
+            declaring_modules = self.related_fields_index.get_declaring_module_paths(
+                ctx.id, all_modules=self._modules or {})
+            source_hashes = self.related_modules.get_source_hashes(ctx.path, declaring_modules)
+            if source_hashes:
+                return {'related_modules': source_hashes}
+        return None
 
-        monkeypatch.add_modules_as_a_source_seed_files(settings_modules)
-        monkeypatch.inject_modules_as_dependencies_for_django_conf_settings(settings_modules)
+    def _get_cached_metadata(self, class_fullname: str,
+                             extract_metadata: Callable[[TypeInfo], Dict[str, Any]]) -> Dict[str, Any]:
+        # class module could be replaced with a fresh tree (cache load, daemon update)
+        module_name = class_fullname.rpartition('.')[0]
+        module_file = self._modules.get(module_name) if self._modules is not None else None
+        cached = self._metadata_cache.get(class_fullname)
+        if cached is not None and cached[0] is module_file:
+            return cached[1]
 
-    def _get_current_model_bases(self) -> Dict[str, int]:
-        model_sym = self.lookup_fully_qualified(helpers.MODEL_CLASS_FULLNAME)
-        if model_sym is not None and isinstance(model_sym.node, TypeInfo):
-            if 'django' not in model_sym.node.metadata:
-                model_sym.node.metadata['django'] = {
-                    'model_bases': {helpers.MODEL_CLASS_FULLNAME: 1}
-                }
-            return model_sym.node.metadata['django']['model_bases']
+        sym = self.lookup_fully_qualified(class_fullname)
+        if sym is not None and isinstance(sym.node, TypeInfo):
+            metadata = extract_metadata(sym.node)
+            self._metadata_cache[class_fullname] = (module_file, metadata)
+            return metadata
         else:
             return {}
 
-    def _get_current_manager_bases(self) -> Dict[str, int]:
-        manager_sym = self.lookup_fully_qualified(helpers.MANAGER_CLASS_FULLNAME)
-        if manager_sym is not None and isinstance(manager_sym.node, TypeInfo):
-            if 'django' not in manager_sym.node.metadata:
-                manager_sym.node.metadata['django'] = {
-                    'manager_bases': {helpers.MANAGER_CLASS_FULLNAME: 1}
-                }
-            return manager_sym.node.metadata['django']['manager_bases']
+    def _get_current_settings(self) -> Dict[str, str]:
+        return self._get_cached_metadata('django.conf.LazySettings', get_settings_metadata)
+
+    def _is_subclass_of(self, fullname: str, registered_bases: Set[str], base_fullname: str) -> bool:
+        if fullname in registered_bases:
+            return True
+        # classes deserialized from the incremental cache do not go through base class hooks
+        sym = self.lookup_fully_qualified(fullname)
+        if sym is not None and isinstance(sym.node, TypeInfo) and sym.node.has_base(base_fullname):
+            registered_bases.add(fullname)
+            return True
+        return False
+
+    def _is_model_class(self, fullname: str) -> bool:
+        return self._is_subclass_of(fullname, self.model_bases, helpers.MODEL_CLASS_FULLNAME)
+
+    def _is_manager_class(self, fullname: str) -> bool:
+        return self._is_subclass_of(fullname, self.manager_bases, helpers.MANAGER_CLASS_FULLNAME)
+
+    def _get_cached_hook(self, hook_kind: str, fullname: str,
+                         resolve_hook: Callable[[str], Optional[Callable[..., Any]]]
+                         ) -> Optional[Callable[..., Any]]:
+        # hook decisions only change when new model or manager classes are registered
+        cache_version = (len(self.model_bases), len(self.manager_bases))
+        if cache_version != self._hooks_cache_version:
+            self._hooks_cache.clear()
+            self._hooks_cache_version = cache_version
+
+        key = (hook_kind, fullname)
+        if key in self._hooks_cache:
+            self._hooks_cache_hits += 1
         else:
-            return {}
+            self._hooks_cache_misses += 1
+            self._hooks_cache[key] = self._profile_hook(hook_kind, resolve_hook(fullname))
+        return self._hooks_cache[key]
 
-    def get_function_hook(self, fullname: str
-                          ) -> Optional[Callable[[FunctionContext], Type]]:
+    def _profile_hook(self, hook_kind: str, hook: Optional[Callable[..., Any]]) -> Optional[Callable[..., Any]]:
+        if self.profiler is None:
+            return hook
+        return self.profiler.wrap(hook_kind, hook)
+
+    def _resolve_function_hook(self, fullname: str
+                               ) -> Optional[Callable[[FunctionContext], Type]]:
         sym = self.lookup_fully_qualified(fullname)
         if sym and isinstance(sym.node, TypeInfo) and sym.node.has_base(helpers.FIELD_FULLNAME):
-            return fields.adjust_return_type_of_field_instantiation
+            return partial(fields.adjust_return_type_of_field_instantiation,
+                           field_calls_index=self.field_calls_index,
+                           apps_registry=self.apps_registry,
+                           expected_types_cache=self.expected_types_cache)
 
         if fullname == 'django.contrib.auth.get_user_model':
-            return return_user_model_hook
+            return partial(return_user_model_hook, settings_index=self.settings_index,
+                           apps_registry=self.apps_registry)
 
-        manager_bases = self._get_current_manager_bases()
-        if fullname in manager_bases:
+        if self._is_manager_class(fullname):
             return determine_proper_manager_type
 
-        sym = self.lookup_fully_qualified(fullname)
         if sym and isinstance(sym.node, TypeInfo):
             if sym.node.metadata.get('django', {}).get('generated_init'):
-                return init_create.redefine_and_typecheck_model_init
+                return partial(init_create.redefine_and_typecheck_model_init,
+                               expected_types_cache=self.expected_types_cache)
+        return None
 
-    def get_method_hook(self, fullname: str
-                        ) -> Optional[Callable[[MethodContext], Type]]:
-        manager_classes = self._get_current_manager_bases()
+    def _resolve_method_hook(self, fullname: str
+                             ) -> Optional[Callable[[MethodContext], Type]]:
         class_fullname, _, method_name = fullname.rpartition('.')
-        if class_fullname in manager_classes and method_name == 'create':
-            return init_create.redefine_and_typecheck_model_create
+        if method_name == 'create' and self._is_manager_class(class_fullname):
+            return partial(init_create.redefine_and_typecheck_model_create,
+                           expected_types_cache=self.expected_types_cache)
 
         if fullname in {'django.apps.registry.Apps.get_model',
                         'django.db.migrations.state.StateApps.get_model'}:
-            return determine_model_cls_from_string_for_migrations
+            return partial(determine_model_cls_from_string_for_migrations, apps_registry=self.apps_registry)
         return None
 
-    def get_base_class_hook(self, fullname: str
-                            ) -> Optional[Callable[[ClassDefContext], None]]:
-        if fullname in self._get_current_model_bases():
-            return transform_model_class
+    def _resolve_base_class_hook(self, fullname: str
+                                 ) -> Optional[Callable[[ClassDefContext], None]]:
+        if self._is_model_class(fullname):
+            return partial(transform_model_class, model_bases=self.model_bases,
+                           related_fields_index=self.related_fields_index,
+                           managers_index=self.managers_index,
+                           related_modules=self.related_modules,
+                           model_schema_export=self.model_schema_export)
 
         if fullname == helpers.DUMMY_SETTINGS_BASE_CLASS:
-            settings_modules = ['django.conf.global_settings']
-            if self.django_settings_module:
-                settings_modules.append(self.django_settings_module)
-            return AddSettingValuesToDjangoConfObject(settings_modules,
-                                                      self.config.ignore_missing_settings)
+            return AddSettingValuesToDjangoConfObject(self.settings_modules,
+                                                      self.config.ignore_missing_settings,
+                                                      lazy_settings=self.config.lazy_settings,
+                                                      import_star_closure=self.import_star_closure)
 
-        if fullname in self._get_current_manager_bases():
-            return transform_manager_class
+        if self._is_manager_class(fullname):
+            return partial(transform_manager_class, manager_bases=self.manager_bases)
 
         return None
 
+    def get_function_hook(self, fullname: str
+                          ) -> Optional[Callable[[FunctionContext], Type]]:
+        return self._get_cached_hook('function', fullname, self._resolve_function_hook)
+
+    def get_method_hook(self, fullname: str
+                        ) -> Optional[Callable[[MethodContext], Type]]:
+        return self._get_cached_hook('method', fullname, self._resolve_method_hook)
+
+    def get_base_class_hook(self, fullname: str
+                            ) -> Optional[Callable[[ClassDefContext], None]]:
+        return self._get_cached_hook('base_class', fullname, self._resolve_base_class_hook)
+
     def get_attribute_hook(self, fullname: str
                            ) -> Optional[Callable[[AttributeContext], Type]]:
-        module, _, name = fullname.rpartition('.')
-        sym = self.lookup_fully_qualified('django.conf.LazySettings')
-        if sym and isinstance(sym.node, TypeInfo):
-            metadata = get_settings_metadata(sym.node)
-            if module == 'builtins.object' and name in metadata:
-                return ExtractSettingType(module_fullname=metadata[name])
-
-        if fullname == 'builtins.object.id':
-            return return_integer_type_for_id_for_non_defined_primary_key_in_models
+        # not cached, as hooks for settings change while settings are analyzed, but they are reused objects
+        hook = self._resolve_attribute_hook(fullname)
+        if hook is None or self.profiler is None:
+            return hook
+        if hook not in self._profiled_attribute_hooks:
+            self._profiled_attribute_hooks[hook] = self._profile_hook('attribute', hook)
+        return self._profiled_attribute_hooks[hook]
+
+    def _resolve_attribute_hook(self, fullname: str
+                                ) -> Optional[Callable[[AttributeContext], Type]]:
+        class_fullname, _, attr_name = fullname.rpartition('.')
+        if class_fullname == 'builtins.object':
+            # unannotated settings and implicit primary key are typed as object
+            settings_metadata = self._get_current_settings()
+            if attr_name in settings_metadata:
+                module_fullname = settings_metadata[attr_name]
+                if module_fullname not in self._setting_type_hooks:
+                    self._setting_type_hooks[module_fullname] = ExtractSettingType(module_fullname=module_fullname)
+                return self._setting_type_hooks[module_fullname]
+
+            if attr_name == 'id':
+                return return_integer_type_for_id_for_non_defined_primary_key_in_models
+            return None
+
+        if class_fullname == 'django.conf.LazySettings' and self.config.lazy_settings:
+            # settings missing from LazySettings symbol table are looked up through __getattr__,
+            # attributes declared in stubs (configured) are left to mypy
+            sym = self.lookup_fully_qualified(class_fullname)
+            if sym is not None and isinstance(sym.node, TypeInfo) and attr_name in sym.node.names:
+                return None
+            return self._lazy_setting_type_hook
+
+        if class_fullname == 'builtins.int' and attr_name.endswith(helpers.RELATED_FIELD_ID_SUFFIX):
+            # <fk>_id attributes are added by the plugin as int
+            return extract_and_return_primary_key_of_bound_related_field_parameter
+
+        sym = self.lookup_fully_qualified(class_fullname)
+        if (sym is not None and isinstance(sym.node, TypeInfo)
+                and attr_name in sym.node.metadata.get('django', {}).get('reverse_relations', {})):
+            return self._related_model_type_hook
 
-        return extract_and_return_primary_key_of_bound_related_field_parameter
+        return None
 
 
 def plugin(version):
@@ -1,4 +0,0 @@
-from .dependencies import (add_modules_as_a_source_seed_files,
-                           inject_modules_as_dependencies_for_django_conf_settings,
-                           restore_original_load_graph,
-                           restore_original_dependencies_handling)
@@ -0,0 +1,134 @@
+import atexit
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dataclasses import dataclass, field
+from mypy.nodes import TypeInfo
+from mypy.plugin import ClassDefContext
+from mypy.types import Instance
+
+# number of slowest models/modules listed in the text report for every hook
+TOP_TARGETS_COUNT = 10
+
+# mypy has no hook called at the end of a build, report is rewritten during the build at most that often,
+# runs which don't call atexit handlers (fast_exit, dmypy) miss only the last seconds of it
+REPORT_WRITE_INTERVAL = 2.0
+
+
+@dataclass
+class HookStats:
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    time_by_target: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, target: str, elapsed: float) -> None:
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.time_by_target[target] = self.time_by_target.get(target, 0.0) + elapsed
+
+    def get_top_targets(self, count: int = TOP_TARGETS_COUNT) -> List[Any]:
+        return sorted(self.time_by_target.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def get_hook_name(hook: Callable[..., Any]) -> str:
+    # partial() objects and callable classes are registered as hooks too
+    hook = getattr(hook, 'func', hook)
+    return getattr(hook, '__name__', type(hook).__name__)
+
+
+def get_hook_target(ctx: Any) -> str:
+    """Model class or module the hook is invoked for"""
+    if isinstance(ctx, ClassDefContext):
+        return ctx.cls.fullname
+
+    scope = getattr(ctx.api, 'scope', None)
+    active_class = scope.active_class() if scope is not None else None
+    if isinstance(active_class, TypeInfo):
+        return active_class.fullname()
+
+    typ = getattr(ctx, 'type', None)
+    if isinstance(typ, Instance):
+        return typ.type.fullname()
+
+    tree = getattr(ctx.api, 'tree', None)
+    if tree is not None:
+        return tree.fullname()
+    return '<unknown>'
+
+
+class HooksProfiler:
+    """
+    Call counts and time spent in every hook returned by the plugin, together with hit ratios
+    of plugin caches. Report is written as <report_path>.txt and <report_path>.json during the build
+    and when mypy exits.
+    """
+
+    def __init__(self, report_path: str) -> None:
+        self.report_path = report_path
+        self.stats: Dict[str, HookStats] = {}
+        # cache name -> function returning (hits, misses)
+        self.caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+        self.report_written_at = time.perf_counter()
+        atexit.register(self.write_report)
+
+    def register_cache(self, name: str, get_counters: Callable[[], Tuple[int, int]]) -> None:
+        self.caches[name] = get_counters
+
+    def wrap(self, hook_kind: str, hook: Optional[Callable[[Any], Any]]) -> Optional[Callable[[Any], Any]]:
+        if hook is None:
+            return None
+
+        stats = self.stats.setdefault(f'{hook_kind}:{get_hook_name(hook)}', HookStats())
+
+        def profiled_hook(ctx: Any) -> Any:
+            started_at = time.perf_counter()
+            try:
+                return hook(ctx)
+            finally:
+                finished_at = time.perf_counter()
+                stats.record(get_hook_target(ctx), finished_at - started_at)
+                if finished_at - self.report_written_at > REPORT_WRITE_INTERVAL:
+                    self.write_report()
+
+        return profiled_hook
+
+    def get_cache_ratios(self) -> Dict[str, Dict[str, Any]]:
+        ratios = {}
+        for name, get_counters in self.caches.items():
+            hits, misses = get_counters()
+            ratios[name] = {'hits': hits,
+                            'misses': misses,
+                            'hit_ratio': hits / (hits + misses) if hits + misses else None}
+        return ratios
+
+    def make_json_report(self) -> Dict[str, Any]:
+        return {
+            'hooks': {name: {'calls': stats.calls,
+                             'total_time': stats.total_time,
+                             'max_time': stats.max_time,
+                             'top_targets': stats.get_top_targets()}
+                      for name, stats in self.stats.items()},
+            'caches': self.get_cache_ratios()
+        }
+
+    def make_text_report(self) -> str:
+        lines = [f'{"hook":<70} {"calls":>10} {"total, s":>10} {"max, ms":>10}']
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].total_time, reverse=True):
+            lines.append(f'{name:<70} {stats.calls:>10} {stats.total_time:>10.3f} {stats.max_time * 1000:>10.2f}')
+            for target, target_time in stats.get_top_targets():
+                lines.append(f'    {target:<66} {"":>10} {target_time:>10.3f}')
+        lines.append('')
+        for name, ratio in self.get_cache_ratios().items():
+            hit_ratio = 'n/a' if ratio['hit_ratio'] is None else f'{ratio["hit_ratio"]:.1%}'
+            lines.append(f'{name}: {ratio["hits"]} hits, {ratio["misses"]} misses, hit ratio {hit_ratio}')
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self) -> None:
+        self.report_written_at = time.perf_counter()
+        with open(self.report_path + '.json', 'w') as report_file:
+            json.dump(self.make_json_report(), report_file, indent=2)
+        with open(self.report_path + '.txt', 'w') as report_file:
+            report_file.write(self.make_text_report())
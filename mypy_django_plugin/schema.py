@@ -0,0 +1,92 @@
+import atexit
+import json
+import os
+from typing import Any, Dict, Tuple
+
+from mypy.nodes import TypeInfo
+from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import AppsRegistry, get_meta_app_label
+
+# bumped on every incompatible change of the summary format
+MODEL_SCHEMA_VERSION = 2
+
+
+def get_model_schema(model: TypeInfo, apps_registry: AppsRegistry) -> Dict[str, Any]:
+    return {
+        'app_label': get_meta_app_label(model.defn) or apps_registry.get_app_label(model.module_name),
+        # recorded by AddRelatedManagers
+        'reverse_relations': dict(helpers.get_django_metadata(model).get('reverse_relations', {})),
+    }
+
+
+class ModelSchemaExport:
+    """
+    Summary of models written to model_schema_export path. Entry of a model is updated by the model base class
+    hook, once reverse relations from all modules of the build are indexed. mypy has no hook called at the end
+    of a build, the file is written once, when the process exits, if any entry changed: runs which don't call
+    atexit handlers (fast_exit, dmypy until it is stopped) don't update it. Entries of models loaded from
+    the incremental cache are kept from previous runs.
+    """
+
+    def __init__(self, fpath: str) -> None:
+        self.fpath = fpath
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.changed = False
+        atexit.register(self.flush)
+        if os.path.exists(fpath):
+            try:
+                self.models = ModelSchema.from_file(fpath).models
+            except ValueError:
+                # written by another version of the plugin, or broken
+                pass
+
+    def update_model(self, model: TypeInfo, apps_registry: AppsRegistry) -> None:
+        model_schema = get_model_schema(model, apps_registry)
+        if self.models.get(model.fullname()) == model_schema:
+            return None
+        self.models[model.fullname()] = model_schema
+        self.changed = True
+
+    def flush(self) -> None:
+        if self.changed:
+            self.save()
+            self.changed = False
+
+    def save(self) -> None:
+        # readers never see a partially written file
+        tmp_fpath = f'{self.fpath}.{os.getpid()}.tmp'
+        with open(tmp_fpath, 'w') as schema_file:
+            json.dump({'version': MODEL_SCHEMA_VERSION, 'models': self.models}, schema_file,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_fpath, self.fpath)
+
+
+class ModelSchema:
+    """
+    Summary of models exported by a full run with model_schema_export, used instead of analyzing
+    models modules which are referenced only by "app_label.Model" strings and reverse relations.
+    """
+
+    def __init__(self, models: Dict[str, Dict[str, Any]]) -> None:
+        self.models = models
+        # (lowercased app label, lowercased model name) -> model fullname
+        self.model_fullnames: Dict[Tuple[str, str], str] = {}
+        for model_fullname, model_schema in models.items():
+            model_name = model_fullname.rpartition('.')[2]
+            self.model_fullnames[(model_schema['app_label'].lower(), model_name.lower())] = model_fullname
+
+    @classmethod
+    def from_file(cls, fpath: str) -> 'ModelSchema':
+        with open(fpath) as schema_file:
+            schema = json.load(schema_file)
+        if schema.get('version') != MODEL_SCHEMA_VERSION:
+            raise ValueError(f'Invalid model schema file {fpath}: version {schema.get("version")} is not supported, '
+                             f'export it again with this version of the plugin')
+        return cls(schema['models'])
+
+    def has_model(self, model_string: str) -> bool:
+        app_label, _, model_name = model_string.rpartition('.')
+        return (app_label.lower(), model_name.lower()) in self.model_fullnames
+
+    def register_models(self, apps_registry: AppsRegistry) -> None:
+        apps_registry.models.update(self.model_fullnames)
@@ -0,0 +1,178 @@
+"""
+Prebuilt mypy cache of django-stubs, to skip analysis of the stubs on cold runs (fresh CI jobs).
+
+`build` runs mypy with the plugin over every stub module and the settings modules, and saves
+the resulting cache directory as a bundle named by the key of the environment it is valid for:
+mypy version, python version, contents of django-stubs and plugin settings configuration.
+`install` copies the bundle with the key of the current environment into the mypy cache directory.
+
+    python -m mypy_django_plugin.stubs_cache build --output .django_stubs_cache -- --config-file mypy.ini
+    python -m mypy_django_plugin.stubs_cache install --bundles .django_stubs_cache --cache-dir .mypy_cache
+
+Bundle is relocatable: data files keep their modification times, which cache metadata refers to,
+and when stubs are installed to another path, mypy revalidates cached modules by hash of the sources
+instead of analyzing them again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from mypy import api
+from mypy.version import __version__ as mypy_version
+from mypy_django_plugin.config import Config
+
+MANIFEST_FNAME = 'manifest.json'
+
+
+def find_stubs_directory() -> Path:
+    for search_path in sys.path:
+        stubs_directory = Path(search_path or os.curdir) / 'django-stubs'
+        if stubs_directory.is_dir():
+            return stubs_directory
+    # running from the source checkout
+    return Path(__file__).parent.parent / 'django-stubs'
+
+
+def get_stub_modules(stubs_directory: Path) -> List[str]:
+    """Importable modules, mypy fails the whole run on -m module of a directory without __init__.pyi"""
+    modules = []
+    for fpath in sorted(stubs_directory.glob('**/*.pyi')):
+        relative_fpath = fpath.relative_to(stubs_directory)
+        if any(not (stubs_directory / package_path / '__init__.pyi').is_file()
+               for package_path in list(relative_fpath.parents)[:-1]):
+            continue
+        parts = list(relative_fpath.with_suffix('').parts)
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        modules.append('.'.join(['django'] + parts))
+    return modules
+
+
+def get_stubs_hash(stubs_directory: Path) -> str:
+    stubs_hash = hashlib.sha1()
+    for fpath in sorted(stubs_directory.glob('**/*.pyi')):
+        stubs_hash.update(str(fpath.relative_to(stubs_directory)).encode())
+        stubs_hash.update(fpath.read_bytes())
+    return stubs_hash.hexdigest()
+
+
+def find_module_file(module_name: str, search_paths: List[str]) -> Optional[Path]:
+    module_path = os.path.join(*module_name.split('.'))
+    for search_path in search_paths:
+        for candidate in [module_path + '.py', module_path + '.pyi',
+                          os.path.join(module_path, '__init__.py'), os.path.join(module_path, '__init__.pyi')]:
+            if os.path.isfile(os.path.join(search_path, candidate)):
+                return Path(search_path) / candidate
+    return None
+
+
+def get_settings_hash(config: Config) -> str:
+    """Plugin options which change django.conf and contents of the project settings modules"""
+    search_paths = [os.getcwd()]
+    if 'MYPYPATH' in os.environ:
+        search_paths.extend(os.environ['MYPYPATH'].split(os.pathsep))
+
+    settings_hash = hashlib.sha1(json.dumps(config.get_settings_config_data(), sort_keys=True).encode())
+    for settings_module in config.get_settings_modules():
+        fpath = find_module_file(settings_module, search_paths)
+        if fpath is not None:
+            settings_hash.update(fpath.read_bytes())
+    return settings_hash.hexdigest()
+
+
+def get_bundle_key_parts(config: Config) -> Dict[str, str]:
+    return {'mypy_version': mypy_version,
+            'python_version': '{}.{}'.format(*sys.version_info[:2]),
+            'stubs_hash': get_stubs_hash(find_stubs_directory()),
+            'settings_hash': get_settings_hash(config)}
+
+
+def get_bundle_key(key_parts: Dict[str, str]) -> str:
+    parts_hash = hashlib.sha1(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+    return f'mypy{key_parts["mypy_version"]}-py{key_parts["python_version"]}-{parts_hash[:16]}'
+
+
+def build_bundle(bundles_directory: Path, mypy_args: List[str]) -> Path:
+    config = Config.from_environment()
+    key_parts = get_bundle_key_parts(config)
+    bundle_directory = bundles_directory / get_bundle_key(key_parts)
+
+    # modules passed with -m are analyzed without ignore_all flag, so their cache is
+    # valid both for projects which follow imports normally and silently
+    modules = [*get_stub_modules(find_stubs_directory()), *config.get_settings_modules()[1:]]
+    with tempfile.TemporaryDirectory() as cache_directory:
+        module_args = [arg for module_name in modules for arg in ['-m', module_name]]
+        # on mypy<0.750 cache of models modules referenced by related fields is dropped after the first run,
+        # to be written again with dependencies on the declaring modules, see RelatedModulesStore
+        for _ in range(2):
+            _, stderr, exit_status = api.run([*mypy_args, '--incremental', '--cache-dir', cache_directory,
+                                              *module_args])
+            # 1 is reported for type errors, which are fine for the cache
+            if exit_status not in (0, 1):
+                raise RuntimeError(f'mypy failed to analyze django-stubs:\n{stderr}')
+
+        if bundle_directory.exists():
+            shutil.rmtree(bundle_directory)
+        # copy2() keeps modification times of data files, they are checked against metadata
+        shutil.copytree(cache_directory, bundle_directory, copy_function=shutil.copy2)
+
+    (bundle_directory / MANIFEST_FNAME).write_text(json.dumps(key_parts, indent=4, sort_keys=True) + '\n')
+    return bundle_directory
+
+
+def install_bundle(bundles_directory: Path, cache_directory: Path) -> Optional[Path]:
+    """Copy bundle for the current environment into cache directory, files already there are kept"""
+    bundle_directory = bundles_directory / get_bundle_key(get_bundle_key_parts(Config.from_environment()))
+    if not bundle_directory.is_dir():
+        return None
+
+    for fpath in bundle_directory.glob('**/*'):
+        if fpath.is_dir() or fpath.name == MANIFEST_FNAME:
+            continue
+        target_fpath = cache_directory / fpath.relative_to(bundle_directory)
+        if not target_fpath.exists():
+            target_fpath.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(fpath, target_fpath)
+    return bundle_directory
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Prebuilt mypy cache of django-stubs')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='analyze django-stubs and save the cache as a bundle')
+    build_parser.add_argument('--output', type=Path, default=Path('.django_stubs_cache'),
+                              help='directory to save bundles to')
+    build_parser.add_argument('mypy_args', nargs='*',
+                              help='mypy options, like --config-file, should match options of the project')
+
+    install_parser = subparsers.add_parser('install', help='copy bundle for the current environment into cache')
+    install_parser.add_argument('--bundles', type=Path, default=Path('.django_stubs_cache'),
+                                help='directory with bundles saved by build')
+    install_parser.add_argument('--cache-dir', type=Path, default=Path('.mypy_cache'),
+                                help='mypy cache directory')
+
+    args: Any = parser.parse_args(argv)
+    if args.command == 'build':
+        bundle_directory = build_bundle(args.output, args.mypy_args)
+        print(f'django-stubs cache saved to {bundle_directory}')
+        return 0
+
+    bundle_directory = install_bundle(args.bundles, args.cache_dir)
+    if bundle_directory is None:
+        print(f'No django-stubs cache for the current environment in {args.bundles}, run build first',
+              file=sys.stderr)
+        return 1
+    print(f'django-stubs cache installed from {bundle_directory}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
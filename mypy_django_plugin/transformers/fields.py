@@ -1,14 +1,19 @@
-from typing import Optional, cast
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, cast
 
 from mypy.checker import TypeChecker
-from mypy.nodes import ListExpr, NameExpr, StrExpr, TupleExpr, TypeInfo, Var
+from mypy.nodes import ClassDef, Context, ListExpr, NameExpr, StrExpr, TupleExpr, TypeInfo, Var
 from mypy.plugin import FunctionContext
 from mypy.types import AnyType, CallableType, Instance, TupleType, Type, TypeOfAny, UnionType
 from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import AppsRegistry
+from mypy_django_plugin.helpers import get_private_descriptor_type
 from mypy_django_plugin.transformers.models import iter_over_assignments
 
+if TYPE_CHECKING:
+    from mypy_django_plugin.transformers.init_create import ExpectedTypesCache
 
-def extract_referred_to_type(ctx: FunctionContext) -> Optional[Instance]:
+
+def extract_referred_to_type(ctx: FunctionContext, apps_registry: AppsRegistry) -> Optional[Instance]:
     api = cast(TypeChecker, ctx.api)
     if 'to' not in ctx.callee_arg_names:
         api.msg.fail(f'to= parameter must be set for {ctx.context.callee.fullname}',
@@ -22,8 +27,8 @@ def extract_referred_to_type(ctx: FunctionContext) -> Optional[Instance]:
             # not string, not supported
             return None
         try:
-            model_fullname = helpers.get_model_fullname_from_string(to_arg_expr.value,
-                                                                    all_modules=api.modules)
+            model_fullname = apps_registry.get_model_fullname_from_string(to_arg_expr.value,
+                                                                          all_modules=api.modules)
         except helpers.SelfReference:
             model_fullname = api.tscope.classes[-1].fullname()
 
@@ -72,9 +77,9 @@ def convert_any_to_type(typ: Type, referred_to_type: Type) -> Type:
     return typ
 
 
-def fill_descriptor_types_for_related_field(ctx: FunctionContext) -> Type:
+def fill_descriptor_types_for_related_field(ctx: FunctionContext, apps_registry: AppsRegistry) -> Type:
     default_return_type = set_descriptor_types_for_field(ctx)
-    referred_to_type = extract_referred_to_type(ctx)
+    referred_to_type = extract_referred_to_type(ctx, apps_registry)
     if referred_to_type is None:
         return default_return_type
 
@@ -86,16 +91,6 @@ def fill_descriptor_types_for_related_field(ctx: FunctionContext) -> Type:
     return helpers.reparametrize_instance(ctx.default_return_type, new_args=args)
 
 
-def get_private_descriptor_type(type_info: TypeInfo, private_field_name: str, is_nullable: bool) -> Type:
-    node = type_info.get(private_field_name).node
-    if isinstance(node, Var):
-        descriptor_type = node.type
-        if is_nullable:
-            descriptor_type = helpers.make_optional(descriptor_type)
-        return descriptor_type
-    return AnyType(TypeOfAny.unannotated)
-
-
 def set_descriptor_types_for_field(ctx: FunctionContext) -> Instance:
     default_return_type = cast(Instance, ctx.default_return_type)
     is_nullable = helpers.parse_bool(helpers.get_argument_by_name(ctx, 'null'))
@@ -125,7 +120,7 @@ def determine_type_of_array_field(ctx: FunctionContext) -> Type:
     return helpers.reparametrize_instance(default_return_type, args)
 
 
-def transform_into_proper_return_type(ctx: FunctionContext) -> Type:
+def transform_into_proper_return_type(ctx: FunctionContext, apps_registry: AppsRegistry) -> Type:
     default_return_type = ctx.default_return_type
     if not isinstance(default_return_type, Instance):
         return default_return_type
@@ -133,7 +128,7 @@ def transform_into_proper_return_type(ctx: FunctionContext) -> Type:
     if helpers.has_any_of_bases(default_return_type.type, (helpers.FOREIGN_KEY_FULLNAME,
                                                            helpers.ONETOONE_FIELD_FULLNAME,
                                                            helpers.MANYTOMANY_FIELD_FULLNAME)):
-        return fill_descriptor_types_for_related_field(ctx)
+        return fill_descriptor_types_for_related_field(ctx, apps_registry)
 
     if default_return_type.type.has_base(helpers.ARRAY_FIELD_FULLNAME):
         return determine_type_of_array_field(ctx)
@@ -141,34 +136,52 @@ def transform_into_proper_return_type(ctx: FunctionContext) -> Type:
     return set_descriptor_types_for_field(ctx)
 
 
-def adjust_return_type_of_field_instantiation(ctx: FunctionContext) -> Type:
-    record_field_properties_into_outer_model_class(ctx)
-    return transform_into_proper_return_type(ctx)
-
-
-def record_field_properties_into_outer_model_class(ctx: FunctionContext) -> None:
+class FieldCallsIndex:
+    """
+    Names of fields by their instantiation expressions, built once per model class body.
+    """
+
+    def __init__(self) -> None:
+        self.field_names: Dict[str, Tuple[ClassDef, Dict[Context, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_field_name(self, model: TypeInfo, field_call: Context) -> Optional[str]:
+        cached = self.field_names.get(model.fullname())
+        if cached is not None and cached[0] is model.defn:
+            self.hits += 1
+        else:
+            self.misses += 1
+            field_names: Dict[Context, str] = {}
+            for name_expr, stmt in iter_over_assignments(model.defn):
+                if isinstance(name_expr, NameExpr):
+                    field_names[stmt] = name_expr.name
+            cached = (model.defn, field_names)
+            self.field_names[model.fullname()] = cached
+        return cached[1].get(field_call)
+
+
+def adjust_return_type_of_field_instantiation(ctx: FunctionContext, field_calls_index: FieldCallsIndex,
+                                              apps_registry: AppsRegistry,
+                                              expected_types_cache: 'ExpectedTypesCache') -> Type:
+    record_field_properties_into_outer_model_class(ctx, field_calls_index, expected_types_cache)
+    return transform_into_proper_return_type(ctx, apps_registry)
+
+
+def record_field_properties_into_outer_model_class(ctx: FunctionContext, field_calls_index: FieldCallsIndex,
+                                                   expected_types_cache: 'ExpectedTypesCache') -> None:
     api = cast(TypeChecker, ctx.api)
     outer_model = api.scope.active_class()
     if outer_model is None or not outer_model.has_base(helpers.MODEL_CLASS_FULLNAME):
         # outside models.Model class, undetermined
         return
 
-    field_name = None
-    for name_expr, stmt in iter_over_assignments(outer_model.defn):
-        if stmt == ctx.context and isinstance(name_expr, NameExpr):
-            field_name = name_expr.name
-            break
+    field_name = field_calls_index.get_field_name(outer_model, ctx.context)
     if field_name is None:
         return
 
-    fields_metadata = outer_model.metadata.setdefault('django', {}).setdefault('fields', {})
-
-    # primary key
-    is_primary_key = False
-    primary_key_arg = helpers.get_argument_by_name(ctx, 'primary_key')
-    if primary_key_arg:
-        is_primary_key = helpers.parse_bool(primary_key_arg)
-    fields_metadata[field_name] = {'primary_key': is_primary_key}
+    # primary_key, null, blank and default are recorded during semantic analysis of the model class
+    field_metadata = helpers.get_fields_metadata(outer_model).setdefault(field_name, {})
 
     # choices
     choices_arg = helpers.get_argument_by_name(ctx, 'choices')
@@ -177,24 +190,8 @@ def record_field_properties_into_outer_model_class(ctx: FunctionContext) -> None
         _, analyzed_choices = api.analyze_iterable_item_type(choices_arg)
         if isinstance(analyzed_choices, TupleType):
             first_element_type = analyzed_choices.items[0]
-            if isinstance(first_element_type, Instance):
-                fields_metadata[field_name]['choices'] = first_element_type.type.fullname()
-
-    # nullability
-    null_arg = helpers.get_argument_by_name(ctx, 'null')
-    is_nullable = False
-    if null_arg:
-        is_nullable = helpers.parse_bool(null_arg)
-    fields_metadata[field_name]['null'] = is_nullable
-
-    # is_blankable
-    blank_arg = helpers.get_argument_by_name(ctx, 'blank')
-    is_blankable = False
-    if blank_arg:
-        is_blankable = helpers.parse_bool(blank_arg)
-    fields_metadata[field_name]['blank'] = is_blankable
-
-    # default
-    default_arg = helpers.get_argument_by_name(ctx, 'default')
-    if default_arg and not helpers.is_none_expr(default_arg):
-        fields_metadata[field_name]['default_specified'] = True
+            if (isinstance(first_element_type, Instance)
+                    and field_metadata.get('choices') != first_element_type.type.fullname()):
+                field_metadata['choices'] = first_element_type.type.fullname()
+                # constructor signatures of the model and its subclasses depend on field properties
+                expected_types_cache.invalidate(outer_model)
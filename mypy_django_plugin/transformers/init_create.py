@@ -1,12 +1,12 @@
-from typing import Dict, Optional, Set, cast
+from typing import Dict, Optional, Set, Tuple, cast
 
 from mypy.checker import TypeChecker
 from mypy.nodes import TypeInfo, Var
 from mypy.plugin import FunctionContext, MethodContext
 from mypy.types import AnyType, Instance, Type, TypeOfAny
 from mypy_django_plugin import helpers
-from mypy_django_plugin.helpers import extract_field_setter_type, extract_explicit_set_type_of_model_primary_key, get_fields_metadata
-from mypy_django_plugin.transformers.fields import get_private_descriptor_type
+from mypy_django_plugin.helpers import extract_explicit_set_type_of_model_primary_key, extract_field_setter_type, \
+    get_field_metadata, get_private_descriptor_type
 
 
 def extract_base_pointer_args(model: TypeInfo) -> Set[str]:
@@ -19,13 +19,13 @@ def extract_base_pointer_args(model: TypeInfo) -> Set[str]:
     return pointer_args
 
 
-def redefine_and_typecheck_model_init(ctx: FunctionContext) -> Type:
+def redefine_and_typecheck_model_init(ctx: FunctionContext, expected_types_cache: 'ExpectedTypesCache') -> Type:
     assert isinstance(ctx.default_return_type, Instance)
 
     api = cast(TypeChecker, ctx.api)
     model: TypeInfo = ctx.default_return_type.type
 
-    expected_types = extract_expected_types(ctx, model, is_init=True)
+    expected_types = expected_types_cache.get_expected_types(ctx, model, is_init=True)
 
     # order is preserved, can be used for positionals
     positional_names = list(expected_types.keys())
@@ -68,7 +68,7 @@ def redefine_and_typecheck_model_init(ctx: FunctionContext) -> Type:
     return ctx.default_return_type
 
 
-def redefine_and_typecheck_model_create(ctx: MethodContext) -> Type:
+def redefine_and_typecheck_model_create(ctx: MethodContext, expected_types_cache: 'ExpectedTypesCache') -> Type:
     api = cast(TypeChecker, ctx.api)
     if isinstance(ctx.type, Instance) and len(ctx.type.args) > 0:
         model_generic_arg = ctx.type.args[0]
@@ -82,7 +82,7 @@ def redefine_and_typecheck_model_create(ctx: MethodContext) -> Type:
 
     # extract name of base models for _ptr
     base_pointer_args = extract_base_pointer_args(model)
-    expected_types = extract_expected_types(ctx, model)
+    expected_types = expected_types_cache.get_expected_types(ctx, model)
 
     for actual_name, actual_type in zip(ctx.arg_names[0], ctx.arg_types[0]):
         if actual_name in base_pointer_args:
@@ -106,7 +106,7 @@ def redefine_and_typecheck_model_create(ctx: MethodContext) -> Type:
 
 
 def extract_choices_type(model: TypeInfo, field_name: str) -> Optional[str]:
-    field_metadata = get_fields_metadata(model).get(field_name, {})
+    field_metadata = get_field_metadata(model, field_name)
     if 'choices' in field_metadata:
         return field_metadata['choices']
     return None
@@ -117,7 +117,7 @@ def extract_expected_types(ctx: FunctionContext, model: TypeInfo,
     api = cast(TypeChecker, ctx.api)
 
     expected_types: Dict[str, Type] = {}
-    primary_key_type = extract_explicit_set_type_of_model_primary_key(model)
+    primary_key_type = extract_explicit_set_type_of_model_primary_key(model, api)
     if not primary_key_type:
         # no explicit primary key, set pk to Any and add id
         primary_key_type = AnyType(TypeOfAny.special_form)
@@ -157,7 +157,7 @@ def extract_expected_types(ctx: FunctionContext, model: TypeInfo,
                             referred_to_model = helpers.make_required(typ.args[1])
 
                         if isinstance(referred_to_model, Instance) and referred_to_model.type.has_base(helpers.MODEL_CLASS_FULLNAME):
-                            pk_type = extract_explicit_set_type_of_model_primary_key(referred_to_model.type)
+                            pk_type = extract_explicit_set_type_of_model_primary_key(referred_to_model.type, api)
                             if not pk_type:
                                 # extract set type of AutoField
                                 autofield_info = api.lookup_typeinfo('django.db.models.fields.AutoField')
@@ -170,7 +170,7 @@ def extract_expected_types(ctx: FunctionContext, model: TypeInfo,
 
                         expected_types[name + '_id'] = related_primary_key_type
 
-                    field_metadata = get_fields_metadata(model).get(name, {})
+                    field_metadata = get_field_metadata(model, name)
                     if field_type:
                         # related fields could be None in __init__ (but should be specified before save())
                         if helpers.has_any_of_bases(typ.type, (helpers.FOREIGN_KEY_FULLNAME,
@@ -184,3 +184,44 @@ def extract_expected_types(ctx: FunctionContext, model: TypeInfo,
                         expected_types[name] = field_type
 
     return expected_types
+
+
+def are_field_types_ready(model: TypeInfo) -> bool:
+    for base in model.mro:
+        for sym in base.names.values():
+            if isinstance(sym.node, Var) and sym.node.type is None:
+                return False
+    return True
+
+
+class ExpectedTypesCache:
+    """
+    Memoized results of extract_expected_types() per model and constructor kind.
+
+    Entries of a model and its subclasses are dropped when recorded properties of its fields change,
+    results computed before all field types are inferred are never stored.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[Tuple[str, bool], Tuple[TypeInfo, Dict[str, Type]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, model: TypeInfo) -> None:
+        for key, (cached_model, _) in list(self.entries.items()):
+            if cached_model.has_base(model.fullname()):
+                del self.entries[key]
+
+    def get_expected_types(self, ctx: FunctionContext, model: TypeInfo,
+                           is_init: bool = False) -> Dict[str, Type]:
+        key = (model.fullname(), is_init)
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] is model:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        expected_types = extract_expected_types(ctx, model, is_init=is_init)
+        if are_field_types_ready(model):
+            self.entries[key] = (model, expected_types)
+        return expected_types
@@ -5,6 +5,7 @@ from mypy.nodes import Expression, StrExpr, TypeInfo
 from mypy.plugin import MethodContext
 from mypy.types import Instance, Type, TypeType
 from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import AppsRegistry
 
 
 def get_string_value_from_expr(expr: Expression) -> Optional[str]:
@@ -14,7 +15,7 @@ def get_string_value_from_expr(expr: Expression) -> Optional[str]:
     return None
 
 
-def determine_model_cls_from_string_for_migrations(ctx: MethodContext) -> Type:
+def determine_model_cls_from_string_for_migrations(ctx: MethodContext, apps_registry: AppsRegistry) -> Type:
     app_label_expr = ctx.args[ctx.callee_arg_names.index('app_label')][0]
     app_label = get_string_value_from_expr(app_label_expr)
     if app_label is None:
@@ -32,7 +33,7 @@ def determine_model_cls_from_string_for_migrations(ctx: MethodContext) -> Type:
         return ctx.default_return_type
 
     api = cast(TypeChecker, ctx.api)
-    model_fullname = helpers.get_model_fullname(app_label, model_name, all_modules=api.modules)
+    model_fullname = apps_registry.get_model_fullname(app_label, model_name, all_modules=api.modules)
 
     if model_fullname is None:
         return ctx.default_return_type
@@ -1,14 +1,17 @@
+import os
 from abc import ABCMeta, abstractmethod
-from typing import Dict, Iterator, List, Optional, Tuple, cast
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
 
 import dataclasses
 from mypy.nodes import ARG_STAR, ARG_STAR2, Argument, CallExpr, ClassDef, Expression, IndexExpr, \
-    Lvalue, MDEF, MemberExpr, MypyFile, NameExpr, StrExpr, SymbolTableNode, TypeInfo, Var
+    Lvalue, MDEF, MemberExpr, MypyFile, NameExpr, RefExpr, StrExpr, SymbolTableNode, TypeInfo, Var
 from mypy.plugin import ClassDefContext
 from mypy.plugins.common import add_method
 from mypy.semanal import SemanticAnalyzerPass2
-from mypy.types import AnyType, Instance, NoneTyp, TypeOfAny
+from mypy.server.trigger import make_trigger
+from mypy.types import AnyType, Instance, LiteralType, NoneTyp, TupleType, Type, TypeOfAny
 from mypy_django_plugin import helpers
+from mypy_django_plugin.apps import AppsRegistry
 from mypy_django_plugin.helpers import iter_over_assignments
 
 
@@ -73,7 +76,7 @@ def iter_over_one_to_n_related_fields(klass: ClassDef) -> Iterator[Tuple[NameExp
 class SetIdAttrsForRelatedFields(ModelClassInitializer):
     def run(self) -> None:
         for lvalue, rvalue in iter_over_one_to_n_related_fields(self.model_classdef):
-            node_name = lvalue.name + '_id'
+            node_name = lvalue.name + helpers.RELATED_FIELD_ID_SUFFIX
             self.add_new_node_to_model_class(name=node_name,
                                              typ=self.api.builtin_type('builtins.int'))
 
@@ -95,7 +98,48 @@ def get_model_argument(manager_info: TypeInfo) -> Optional[Instance]:
     return None
 
 
+class ManagersIndex:
+    """
+    Managers declared in class bodies, scanned once per class and shared by all models inheriting from it.
+    """
+
+    def __init__(self) -> None:
+        # class fullname -> (class definition, [(manager name, manager class)])
+        self.declared_managers: Dict[str, Tuple[ClassDef, List[Tuple[str, TypeInfo]]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_declared_managers(self, info: TypeInfo) -> List[Tuple[str, TypeInfo]]:
+        cached = self.declared_managers.get(info.fullname())
+        if cached is not None and cached[0] is info.defn:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        managers = []
+        for name_expr, member_expr in iter_call_assignments(info.defn):
+            manager_name = name_expr.name
+            callee_expr = member_expr.callee
+            if isinstance(callee_expr, IndexExpr):
+                callee_expr = callee_expr.analyzed.expr
+            if isinstance(callee_expr, (MemberExpr, NameExpr)) \
+                and isinstance(callee_expr.node, TypeInfo) \
+                and callee_expr.node.has_base(helpers.BASE_MANAGER_CLASS_FULLNAME):
+                managers.append((manager_name, callee_expr.node))
+        self.declared_managers[info.fullname()] = (info.defn, managers)
+        return managers
+
+    def get_managers(self, model: TypeInfo) -> List[Tuple[str, TypeInfo]]:
+        managers = []
+        for base in model.mro:
+            managers.extend(self.get_declared_managers(base))
+        return managers
+
+
+@dataclasses.dataclass
 class AddDefaultObjectsManager(ModelClassInitializer):
+    managers_index: ManagersIndex
+
     def add_new_manager(self, name: str, manager_type: Optional[Instance]) -> None:
         if manager_type is None:
             return None
@@ -107,18 +151,7 @@ class AddDefaultObjectsManager(ModelClassInitializer):
         self.add_new_node_to_model_class('_default_manager', manager_type)
 
     def get_existing_managers(self) -> List[Tuple[str, TypeInfo]]:
-        managers = []
-        for base in self.model_classdef.info.mro:
-            for name_expr, member_expr in iter_call_assignments(base.defn):
-                manager_name = name_expr.name
-                callee_expr = member_expr.callee
-                if isinstance(callee_expr, IndexExpr):
-                    callee_expr = callee_expr.analyzed.expr
-                if isinstance(callee_expr, (MemberExpr, NameExpr)) \
-                    and isinstance(callee_expr.node, TypeInfo) \
-                    and callee_expr.node.has_base(helpers.BASE_MANAGER_CLASS_FULLNAME):
-                    managers.append((manager_name, callee_expr.node))
-        return managers
+        return self.managers_index.get_managers(self.model_classdef.info)
 
     def run(self) -> None:
         existing_managers = self.get_existing_managers()
@@ -147,48 +180,342 @@ class AddDefaultObjectsManager(ModelClassInitializer):
             self.add_private_default_manager(first_manager_type)
 
 
+class RecordFieldsMetadata(ModelClassInitializer):
+    """
+    Properties of fields and the primary key of the model, with entries inherited from base models,
+    so lookups don't need to walk the MRO.
+    """
+
+    def run(self) -> None:
+        django_metadata = helpers.get_django_metadata(self.model_classdef.info)
+        fields_metadata: Dict[str, Dict[str, Any]] = {}
+        primary_key_metadata: Dict[str, Any] = {}
+        for base in reversed(self.model_classdef.info.mro[1:]):
+            base_metadata = base.metadata.get('django', {})
+            fields_metadata.update(base_metadata.get('fields', {}))
+            if 'primary_key' in base_metadata:
+                primary_key_metadata = {'primary_key': base_metadata['primary_key'],
+                                        'primary_key_class': base_metadata.get('primary_key_class')}
+
+        has_own_primary_key = False
+        for lvalue, rvalue in iter_call_assignments(self.model_classdef):
+            if not isinstance(lvalue, NameExpr):
+                continue
+            field_class = rvalue.callee.node if isinstance(rvalue.callee, RefExpr) else None
+            is_primary_key = self.get_bool_argument(rvalue, 'primary_key')
+            if is_primary_key and not has_own_primary_key:
+                has_own_primary_key = True
+                primary_key_metadata = {'primary_key': lvalue.name, 'primary_key_class': None}
+                if (isinstance(field_class, TypeInfo)
+                        and not helpers.has_any_of_bases(field_class, (helpers.FOREIGN_KEY_FULLNAME,
+                                                                       helpers.ONETOONE_FIELD_FULLNAME))):
+                    primary_key_metadata['primary_key_class'] = field_class.fullname()
+
+            if not isinstance(field_class, TypeInfo) or not field_class.has_base(helpers.FIELD_FULLNAME):
+                continue
+            field_metadata = {'primary_key': is_primary_key,
+                              'null': self.get_bool_argument(rvalue, 'null'),
+                              'blank': self.get_bool_argument(rvalue, 'blank')}
+            default_expr = rvalue.args[rvalue.arg_names.index('default')] if 'default' in rvalue.arg_names else None
+            if default_expr is not None and not helpers.is_none_expr(default_expr):
+                field_metadata['default_specified'] = True
+            fields_metadata[lvalue.name] = field_metadata
+
+        django_metadata['fields'] = fields_metadata
+        django_metadata.pop('primary_key', None)
+        django_metadata.pop('primary_key_class', None)
+        if primary_key_metadata:
+            django_metadata['primary_key'] = primary_key_metadata['primary_key']
+            if primary_key_metadata['primary_key_class'] is not None:
+                django_metadata['primary_key_class'] = primary_key_metadata['primary_key_class']
+
+    def get_bool_argument(self, field_call: CallExpr, name: str) -> bool:
+        if name not in field_call.arg_names:
+            return False
+        return bool(helpers.parse_bool(field_call.args[field_call.arg_names.index(name)]))
+
+
 class AddIdAttributeIfPrimaryKeyTrueIsNotSet(ModelClassInitializer):
     def run(self) -> None:
         if self.is_abstract_model():
             # no need for .id attr
             return None
 
-        for _, rvalue in iter_call_assignments(self.model_classdef):
-            if ('primary_key' in rvalue.arg_names
-                and self.api.parse_bool(rvalue.args[rvalue.arg_names.index('primary_key')])):
-                break
-        else:
+        if helpers.get_primary_key_field_name(self.model_classdef.info) is None:
             self.add_new_node_to_model_class('id', self.api.builtin_type('builtins.object'))
 
 
+@dataclasses.dataclass
+class RelatedFieldDeclaration:
+    module_name: str
+    model_classdef: ClassDef
+    field_name: str
+    field_call: CallExpr
+
+
+class RelatedFieldsIndex:
+    """
+    Project-wide index of ForeignKey/OneToOneField/ManyToManyField declarations,
+    keyed by fullname of the model they point to.
+    """
+
+    def __init__(self, apps_registry: AppsRegistry) -> None:
+        self.apps_registry = apps_registry
+        self.related_fields: Dict[str, List[RelatedFieldDeclaration]] = {}
+        # model fullname -> {related manager name: {'model', 'field', 'kind'}}, for related fields declared
+        # in modules outside of the build, read from the model schema summary
+        self.external_reverse_relations: Dict[str, Dict[str, Dict[str, str]]] = {}
+        # same for all related fields, if taken from runtime snapshot of Django app registry,
+        # modules are not scanned for related fields then
+        self.runtime_reverse_relations: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None
+        # same for related fields declared in modules of the build by previous incremental runs, for modules
+        # loaded from the cache after the referenced one
+        self.cached_reverse_relations: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.indexed_modules: Dict[str, MypyFile] = {}
+        # trees of modules parsed since the last update, indexed once
+        self.new_modules: Dict[str, MypyFile] = {}
+        self.targets_by_module: Dict[str, Set[str]] = {}
+        # module of referenced models -> modules with related fields to them
+        self.declaring_modules: Dict[str, Set[str]] = {}
+        # modules with "app_label.Model" references to models not registered yet, by the
+        # (lowercased app label, lowercased model name) key the apps registry is expected to learn
+        self.unresolved_modules: Dict[Tuple[str, str], Set[str]] = {}
+        self.unresolved_keys: Dict[str, Set[Tuple[str, str]]] = {}
+
+    def get_related_fields(self, model_fullname: str) -> List[RelatedFieldDeclaration]:
+        return self.related_fields.get(model_fullname, [])
+
+    def get_declared_related_fields(self, model_classdef: ClassDef,
+                                    module_name: str) -> List[Tuple[str, RelatedFieldDeclaration]]:
+        declared = []
+        for target_fullname in self.targets_by_module.get(module_name, set()):
+            for declaration in self.get_related_fields(target_fullname):
+                if declaration.model_classdef is model_classdef:
+                    declared.append((target_fullname, declaration))
+        return declared
+
+    def add_module(self, module_file: MypyFile) -> None:
+        # called when mypy parses the module, trees loaded from the incremental cache have no class bodies
+        self.new_modules[module_file.fullname()] = module_file
+
+    def get_declaring_module_paths(self, module_name: str, all_modules: Dict[str, MypyFile]) -> Dict[str, str]:
+        declaring_modules = {}
+        for declaring_module in self.declaring_modules.get(module_name, set()):
+            module_file = all_modules.get(declaring_module)
+            if declaring_module != module_name and module_file is not None and module_file.path:
+                declaring_modules[declaring_module] = os.path.abspath(module_file.path)
+        return declaring_modules
+
+    def get_reverse_relations(self, module_name: str) -> Dict[str, Dict[str, Dict[str, str]]]:
+        # related managers added by the module to models of other modules
+        reverse_relations: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for target_fullname in sorted(self.targets_by_module.get(module_name, set())):
+            if target_fullname.rpartition('.')[0] == module_name:
+                continue
+            for declaration in self.get_related_fields(target_fullname):
+                related_manager_name = get_related_manager_name(declaration)
+                if declaration.module_name == module_name and related_manager_name is not None:
+                    reverse_relations.setdefault(target_fullname, {})[related_manager_name] = \
+                        get_reverse_relation(declaration)
+        return reverse_relations
+
+    def update(self, all_modules: Dict[str, MypyFile]) -> None:
+        new_modules, self.new_modules = self.new_modules, {}
+        for module_name, module_file in new_modules.items():
+            if all_modules.get(module_name) is module_file:
+                self.index_module(module_file, all_modules)
+
+        # apps registry learns models as their classes are analyzed, references could be resolvable now
+        for key in [key for key in self.unresolved_modules if key in self.apps_registry.models]:
+            for module_name in self.unresolved_modules.pop(key):
+                if module_name in all_modules:
+                    self.remove_module(module_name)
+                    self.index_module(all_modules[module_name], all_modules)
+
+    def remove_missing_modules(self, model_fullname: str, all_modules: Dict[str, MypyFile]) -> None:
+        # modules removed from the build (daemon updates) don't go through the parser again
+        for module_name in {declaration.module_name for declaration in self.get_related_fields(model_fullname)}:
+            if module_name not in all_modules:
+                self.remove_module(module_name)
+
+    def index_module(self, module_file: MypyFile, all_modules: Dict[str, MypyFile]) -> None:
+        module_name = module_file.fullname()
+        if self.indexed_modules.get(module_name) is module_file:
+            return None
+        self.remove_module(module_name)
+
+        targets = self.targets_by_module.setdefault(module_name, set())
+        for defn in iter_over_classdefs(module_file):
+            for lvalue, rvalue in iter_call_assignments(defn):
+                if not isinstance(lvalue, NameExpr) or not is_related_field(rvalue, module_file):
+                    continue
+                try:
+                    ref_to_fullname = extract_ref_to_fullname(rvalue,
+                                                              module_file=module_file,
+                                                              all_modules=all_modules,
+                                                              apps_registry=self.apps_registry)
+                except helpers.SelfReference:
+                    ref_to_fullname = defn.fullname
+
+                except helpers.SameFileModel as exc:
+                    ref_to_fullname = module_name + '.' + exc.model_cls_name
+
+                if ref_to_fullname is None:
+                    to_expr = extract_to_expr(rvalue)
+                    if isinstance(to_expr, StrExpr):
+                        app_label, _, model_name = to_expr.value.rpartition('.')
+                        key = (app_label.lower(), model_name.lower())
+                        self.unresolved_modules.setdefault(key, set()).add(module_name)
+                        self.unresolved_keys.setdefault(module_name, set()).add(key)
+                    continue
+                declaration = RelatedFieldDeclaration(module_name=module_name,
+                                                      model_classdef=defn,
+                                                      field_name=lvalue.name,
+                                                      field_call=rvalue)
+                self.related_fields.setdefault(ref_to_fullname, []).append(declaration)
+                targets.add(ref_to_fullname)
+                self.declaring_modules.setdefault(ref_to_fullname.rpartition('.')[0], set()).add(module_name)
+
+        self.indexed_modules[module_name] = module_file
+
+    def remove_module(self, module_name: str) -> None:
+        self.indexed_modules.pop(module_name, None)
+        for key in self.unresolved_keys.pop(module_name, set()):
+            unresolved_modules = self.unresolved_modules.get(key, set())
+            unresolved_modules.discard(module_name)
+            if not unresolved_modules:
+                self.unresolved_modules.pop(key, None)
+        for target_fullname in self.targets_by_module.pop(module_name, set()):
+            self.declaring_modules.get(target_fullname.rpartition('.')[0], set()).discard(module_name)
+            declarations = [declaration for declaration in self.related_fields.get(target_fullname, [])
+                            if declaration.module_name != module_name]
+            if declarations:
+                self.related_fields[target_fullname] = declarations
+            else:
+                self.related_fields.pop(target_fullname, None)
+
+
+@dataclasses.dataclass
 class AddRelatedManagers(ModelClassInitializer):
+    """
+    Related managers for related fields declared in other modules are typed with Any in place of the related model,
+    the referenced module would need their modules in its incremental cache otherwise, and mypy would put
+    every module with related fields to the model in one SCC with it. Their relations are recorded into
+    the model metadata, the model type is set by the attribute hook, when the related model is loaded.
+    """
+    related_fields_index: RelatedFieldsIndex
+
     def run(self) -> None:
-        for module_name, module_file in self.api.modules.items():
-            for defn in iter_over_classdefs(module_file):
-                for lvalue, rvalue in iter_call_assignments(defn):
-                    if is_related_field(rvalue, module_file):
-                        try:
-                            ref_to_fullname = extract_ref_to_fullname(rvalue,
-                                                                      module_file=module_file,
-                                                                      all_modules=self.api.modules)
-                        except helpers.SelfReference:
-                            ref_to_fullname = defn.fullname
-
-                        except helpers.SameFileModel as exc:
-                            ref_to_fullname = module_name + '.' + exc.model_cls_name
-
-                        if self.model_classdef.fullname == ref_to_fullname:
-                            related_manager_name = defn.name.lower() + '_set'
-                            if 'related_name' in rvalue.arg_names:
-                                related_name_expr = rvalue.args[rvalue.arg_names.index('related_name')]
-                                if not isinstance(related_name_expr, StrExpr):
-                                    return None
-                                related_manager_name = related_name_expr.value
-
-                            typ = get_related_field_type(rvalue, self.api, defn.info)
-                            if typ is None:
-                                return None
-                            self.add_new_node_to_model_class(related_manager_name, typ)
+        helpers.get_django_metadata(self.model_classdef.info)['reverse_relations'] = {}
+        runtime_reverse_relations = self.related_fields_index.runtime_reverse_relations
+        if runtime_reverse_relations is not None:
+            self.add_related_managers_from_summary(runtime_reverse_relations.get(self.model_classdef.fullname, {}),
+                                                   only_unparsed_modules=False)
+            return None
+
+        # current module could be re-analyzed (fine-grained mode), pick up its new tree
+        self.related_fields_index.index_module(self.api.cur_mod_node, all_modules=self.api.modules)
+        self.related_fields_index.update(self.api.modules)
+        self.related_fields_index.remove_missing_modules(self.model_classdef.fullname, all_modules=self.api.modules)
+
+        reverse_relations = []
+        for target_fullname, declaration in self.related_fields_index.get_declared_related_fields(
+                self.model_classdef, module_name=self.api.cur_mod_id):
+            reverse_relations.append(f'{target_fullname}.{get_related_manager_name(declaration) or "+"}')
+            target_module, _, _ = target_fullname.rpartition('.')
+            if target_module != self.api.cur_mod_id:
+                # reprocess module of the referenced model in fine-grained mode, when the related field is added
+                self.api.add_plugin_dependency(make_trigger(declaration.model_classdef.fullname + '.'
+                                                            + declaration.field_name),
+                                               target=target_module)
+                # or only its related_name is changed, field type stays the same then
+                self.api.add_plugin_dependency(make_trigger(declaration.model_classdef.fullname + '.'
+                                                            + helpers.get_reverse_relations_attr(
+                                                                declaration.model_classdef.name)),
+                                               target=target_module)
+        if reverse_relations:
+            self.add_reverse_relations_node(sorted(reverse_relations))
+
+        for declaration in self.related_fields_index.get_related_fields(self.model_classdef.fullname):
+            if declaration.module_name != self.api.cur_mod_id:
+                # reprocess current module in fine-grained mode, when the related field is changed or removed
+                self.api.add_plugin_dependency(make_trigger(declaration.model_classdef.fullname + '.'
+                                                            + declaration.field_name))
+
+            related_manager_name = get_related_manager_name(declaration)
+            if related_manager_name is not None:
+                self.add_related_manager(related_manager_name, get_reverse_relation(declaration))
+
+        # declared in modules outside of the build, or loaded from the incremental cache after the current one
+        self.add_related_managers_from_summary(
+            {**self.related_fields_index.external_reverse_relations.get(self.model_classdef.fullname, {}),
+             **self.related_fields_index.cached_reverse_relations.get(self.model_classdef.fullname, {})},
+            only_unparsed_modules=True)
+
+    def add_reverse_relations_node(self, reverse_relations: List[str]) -> None:
+        # fine-grained mode compares symbol types, not metadata, related managers added to other models
+        # by the current one are written into the type of the attribute for the change to be detected
+        str_type = self.api.named_type('__builtins__.str')
+        typ = TupleType([LiteralType(reverse_relation, fallback=str_type) for reverse_relation in reverse_relations],
+                        fallback=self.api.named_type('__builtins__.tuple', [str_type]))
+        name = helpers.get_reverse_relations_attr(self.model_classdef.name)
+        var = Var(name=name, type=typ)
+        var.info = self.model_classdef.info
+        var._fullname = self.model_classdef.info.fullname() + '.' + name
+        var.is_inferred = True
+        var.is_initialized_in_class = True
+        self.model_classdef.info.names[name] = SymbolTableNode(MDEF, var, plugin_generated=True)
+
+    def add_related_managers_from_summary(self, reverse_relations: Dict[str, Dict[str, str]],
+                                          only_unparsed_modules: bool) -> None:
+        for related_manager_name, relation in reverse_relations.items():
+            related_module, _, _ = relation['model'].rpartition('.')
+            module_file = self.api.modules.get(related_module)
+            if module_file is not None and not module_file.is_cache_skeleton:
+                if only_unparsed_modules:
+                    # parsed in this build, indexed above
+                    continue
+                if related_module != self.api.cur_mod_id:
+                    self.api.add_plugin_dependency(make_trigger(relation['model'] + '.' + relation['field']))
+            self.add_related_manager(related_manager_name, relation)
+
+    def add_related_manager(self, name: str, relation: Dict[str, str]) -> None:
+        related_model_type: Type = AnyType(TypeOfAny.special_form)
+        if relation['model'].rpartition('.')[0] == self.api.cur_mod_id:
+            related_model_sym = self.api.lookup_fully_qualified_or_none(relation['model'])
+            if related_model_sym is not None and isinstance(related_model_sym.node, TypeInfo):
+                related_model_type = Instance(related_model_sym.node, [])
+
+        typ: Optional[Type] = related_model_type
+        if relation['kind'] in {'ForeignKey', 'ManyToManyField'}:
+            typ = self.api.named_type_or_none(helpers.RELATED_MANAGER_CLASS_FULLNAME, args=[related_model_type])
+        if typ is None:
+            return None
+
+        var = Var(name=name, type=typ)
+        var.info = self.model_classdef.info
+        var._fullname = self.model_classdef.info.fullname() + '.' + name
+        var.is_inferred = True
+        var.is_initialized_in_class = True
+        self.model_classdef.info.names[name] = SymbolTableNode(MDEF, var)
+        helpers.get_django_metadata(self.model_classdef.info)['reverse_relations'][name] = relation
+
+
+def get_reverse_relation(declaration: RelatedFieldDeclaration) -> Dict[str, str]:
+    # in format of reverse relations of the model schema summary
+    return {'model': declaration.model_classdef.fullname,
+            'field': declaration.field_name,
+            'kind': cast(RefExpr, declaration.field_call.callee).name}
+
+
+def get_related_manager_name(declaration: RelatedFieldDeclaration) -> Optional[str]:
+    rvalue = declaration.field_call
+    if 'related_name' in rvalue.arg_names:
+        related_name_expr = rvalue.args[rvalue.arg_names.index('related_name')]
+        if not isinstance(related_name_expr, StrExpr):
+            return None
+        return related_name_expr.value
+    return declaration.model_classdef.name.lower() + '_set'
 
 
 def iter_over_classdefs(module_file: MypyFile) -> Iterator[ClassDef]:
@@ -197,37 +524,43 @@ def iter_over_classdefs(module_file: MypyFile) -> Iterator[ClassDef]:
             yield defn
 
 
-def get_related_field_type(rvalue: CallExpr, api: SemanticAnalyzerPass2,
-                           related_model_typ: TypeInfo) -> Optional[Instance]:
-    if rvalue.callee.name in {'ForeignKey', 'ManyToManyField'}:
-        return api.named_type_or_none(helpers.RELATED_MANAGER_CLASS_FULLNAME,
-                                      args=[Instance(related_model_typ, [])])
-    else:
-        return Instance(related_model_typ, [])
+def get_callee_fullname(callee: Expression, module_file: MypyFile) -> Optional[str]:
+    # modules which are not analyzed yet have only imports resolved, callee fullname is not set
+    if isinstance(callee, NameExpr):
+        sym = module_file.names.get(callee.name)
+        return sym.fullname if sym is not None else None
+    if isinstance(callee, MemberExpr) and isinstance(callee.expr, NameExpr):
+        sym = module_file.names.get(callee.expr.name)
+        return sym.fullname + '.' + callee.name if sym is not None and sym.fullname else None
+    return None
 
 
 def is_related_field(expr: CallExpr, module_file: MypyFile) -> bool:
-    if isinstance(expr.callee, MemberExpr) and isinstance(expr.callee.expr, NameExpr):
-        module = module_file.names.get(expr.callee.expr.name)
-        if module \
-            and module.fullname == 'django.db.models' \
-            and expr.callee.name in {'ForeignKey',
-                                     'OneToOneField',
-                                     'ManyToManyField'}:
-            return True
-    return False
+    # models.ForeignKey, with any alias of django.db.models, or ForeignKey imported from it
+    callee_fullname = get_callee_fullname(expr.callee, module_file)
+    if callee_fullname is None:
+        return False
+    module_name, _, class_name = callee_fullname.rpartition('.')
+    return (module_name in {'django.db.models', 'django.db.models.fields.related'}
+            and class_name in {'ForeignKey', 'OneToOneField', 'ManyToManyField'})
 
 
-def extract_ref_to_fullname(rvalue_expr: CallExpr,
-                            module_file: MypyFile, all_modules: Dict[str, MypyFile]) -> Optional[str]:
+def extract_to_expr(rvalue_expr: CallExpr) -> Optional[Expression]:
     if 'to' in rvalue_expr.arg_names:
-        to_expr = rvalue_expr.args[rvalue_expr.arg_names.index('to')]
-    else:
-        to_expr = rvalue_expr.args[0]
+        return rvalue_expr.args[rvalue_expr.arg_names.index('to')]
+    if rvalue_expr.args:
+        return rvalue_expr.args[0]
+    return None
+
+
+def extract_ref_to_fullname(rvalue_expr: CallExpr,
+                            module_file: MypyFile, all_modules: Dict[str, MypyFile],
+                            apps_registry: AppsRegistry) -> Optional[str]:
+    to_expr = extract_to_expr(rvalue_expr)
     if isinstance(to_expr, NameExpr):
         return module_file.names[to_expr.name].fullname
     elif isinstance(to_expr, StrExpr):
-        typ_fullname = helpers.get_model_fullname_from_string(to_expr.value, all_modules)
+        typ_fullname = apps_registry.get_model_fullname_from_string(to_expr.value, all_modules)
         if typ_fullname is None:
             return None
         return typ_fullname
@@ -247,17 +580,25 @@ def add_dummy_init_method(ctx: ClassDefContext) -> None:
     ctx.cls.info.metadata.setdefault('django', {})['generated_init'] = True
 
 
-def process_model_class(ctx: ClassDefContext) -> None:
+def process_model_class(ctx: ClassDefContext, related_fields_index: RelatedFieldsIndex,
+                        managers_index: ManagersIndex) -> None:
+    InjectAnyAsBaseForNestedMeta.from_ctx(ctx).run()
+    AddDefaultObjectsManager(api=cast(SemanticAnalyzerPass2, ctx.api),
+                             model_classdef=ctx.cls,
+                             managers_index=managers_index).run()
+
     initializers = [
-        InjectAnyAsBaseForNestedMeta,
-        AddDefaultObjectsManager,
+        RecordFieldsMetadata,
         AddIdAttributeIfPrimaryKeyTrueIsNotSet,
         SetIdAttrsForRelatedFields,
-        AddRelatedManagers,
     ]
     for initializer_cls in initializers:
         initializer_cls.from_ctx(ctx).run()
 
+    AddRelatedManagers(api=cast(SemanticAnalyzerPass2, ctx.api),
+                       model_classdef=ctx.cls,
+                       related_fields_index=related_fields_index).run()
+
     add_dummy_init_method(ctx)
 
     # allow unspecified attributes for now
@@ -1,7 +1,10 @@
-from typing import Iterable, List, Optional, cast
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, cast
 
-from mypy.nodes import ClassDef, Context, ImportAll, MypyFile, SymbolNode, SymbolTableNode, TypeInfo, Var
-from mypy.plugin import ClassDefContext
+from mypy.checker import TypeChecker
+from mypy.nodes import ARG_POS, Argument, ClassDef, Context, ImportAll, MemberExpr, MypyFile, SymbolNode, \
+    SymbolTableNode, TypeInfo, Var
+from mypy.plugin import AttributeContext, ClassDefContext
+from mypy.plugins.common import add_method
 from mypy.semanal import SemanticAnalyzerPass2
 from mypy.types import AnyType, Instance, NoneTyp, Type, TypeOfAny, UnionType
 from mypy.util import correct_relative_import
@@ -17,26 +20,36 @@ def filter_out_nones(typ: UnionType) -> List[Type]:
     return [item for item in typ.items if not isinstance(item, NoneTyp)]
 
 
-def make_sym_copy_of_setting(sym: SymbolTableNode) -> Optional[SymbolTableNode]:
-    if isinstance(sym.type, Instance):
-        copied = sym.copy()
-        copied.node.info = sym.type.type
-        return copied
-    elif isinstance(sym.type, UnionType):
-        instances = filter_out_nones(sym.type)
+def get_setting_instance(typ: Optional[Type]) -> Optional[Instance]:
+    if isinstance(typ, Instance):
+        return typ
+    elif isinstance(typ, UnionType):
+        instances = filter_out_nones(typ)
         if len(instances) > 1:
             # plain unions not supported yet
             return None
-        typ = instances[0]
-        if isinstance(typ, Instance):
-            copied = sym.copy()
-            copied.node.info = typ.type
-            return copied
+        if isinstance(instances[0], Instance):
+            return instances[0]
         return None
     else:
         return None
 
 
+def make_sym_copy_of_setting(sym: SymbolTableNode, settings_info: TypeInfo) -> Optional[SymbolTableNode]:
+    instance = get_setting_instance(sym.type)
+    if instance is None:
+        return None
+    # own Var of LazySettings, Var of the settings module would be serialized as a cross reference
+    # to a module attribute, which has no class info in the next incremental run
+    setting_var = cast(Var, sym.node)
+    var = Var(setting_var.name(), sym.type)
+    var.info = instance.type
+    var._fullname = settings_info.fullname() + '.' + var.name()
+    var.is_ready = setting_var.is_ready
+    var.is_inferred = setting_var.is_inferred
+    return SymbolTableNode(sym.kind, var)
+
+
 def get_settings_metadata(lazy_settings_info: TypeInfo):
     return lazy_settings_info.metadata.setdefault('django', {}).setdefault('settings', {})
 
@@ -50,7 +63,7 @@ def load_settings_from_names(settings_classdef: ClassDef,
         for name, sym in module.names.items():
             if name.isupper() and isinstance(sym.node, Var):
                 if sym.type is not None:
-                    copied = make_sym_copy_of_setting(sym)
+                    copied = make_sym_copy_of_setting(sym, settings_classdef.info)
                     if copied is None:
                         continue
                     settings_classdef.info.names[name] = copied
@@ -62,33 +75,146 @@ def load_settings_from_names(settings_classdef: ClassDef,
                 settings_metadata[name] = module.fullname()
 
 
-def get_import_star_modules(api: SemanticAnalyzerPass2, module: MypyFile) -> List[str]:
-    import_star_modules = []
-    for module_import in module.imports:
-        # relative import * are not resolved by mypy
-        if isinstance(module_import, ImportAll) and module_import.relative:
-            absolute_import_path, correct = correct_relative_import(module.fullname(), module_import.relative, module_import.id,
-                                                                    is_cur_package_init_file=False)
+def register_settings_names(settings_classdef: ClassDef,
+                            modules: Iterable[MypyFile]) -> None:
+    settings_metadata = get_settings_metadata(settings_classdef.info)
+
+    for module in modules:
+        for name, sym in module.names.items():
+            if name.isupper() and isinstance(sym.node, Var):
+                settings_metadata[name] = module.fullname()
+
+
+def iter_over_import_star_modules(module_file: MypyFile) -> Iterator[str]:
+    for module_import in module_file.imports:
+        if not isinstance(module_import, ImportAll):
+            continue
+        if module_import.relative:
+            absolute_import_path, correct = correct_relative_import(module_file.fullname(),
+                                                                    module_import.relative,
+                                                                    module_import.id,
+                                                                    module_file.is_package_init_file())
             if not correct:
-                return []
-            for path in [absolute_import_path] + get_import_star_modules(api, module=api.modules.get(absolute_import_path)):
-                if path not in import_star_modules:
-                    import_star_modules.append(path)
-    return import_star_modules
+                continue
+            yield absolute_import_path
+        else:
+            yield module_import.id
+
+
+class ImportStarClosure:
+    """
+    Modules star-imported by a module, directly or through other star imports, ordered so that every module
+    comes after the modules it overrides. Computed once per module tree, import cycles are cut.
+    """
+
+    def __init__(self) -> None:
+        # module name -> (module tree, closure)
+        self.closures: Dict[str, Tuple[MypyFile, List[str]]] = {}
+
+    def get_closure(self, modules: Dict[str, MypyFile], module_name: str) -> List[str]:
+        module = modules.get(module_name)
+        if module is None:
+            return []
+        closure, _ = self._collect(modules, module, visiting={module_name})
+        return closure
+
+    def _collect(self, modules: Dict[str, MypyFile], module: MypyFile,
+                 visiting: Set[str]) -> Tuple[List[str], bool]:
+        cached = self.closures.get(module.fullname())
+        if cached is not None and cached[0] is module:
+            return cached[1], True
+
+        closure: Dict[str, None] = {}
+        # closure is not cached if the cycle was cut, as it depends on where the traversal started
+        is_complete = True
+        for star_import_module in iter_over_import_star_modules(module):
+            if star_import_module in visiting:
+                is_complete = False
+                continue
+            star_import_file = modules.get(star_import_module)
+            if star_import_file is None:
+                continue
+            nested_closure, is_nested_complete = self._collect(modules, star_import_file,
+                                                               visiting | {star_import_module})
+            is_complete = is_complete and is_nested_complete
+            closure.update(dict.fromkeys(nested_closure))
+            closure[star_import_module] = None
+
+        closure.pop(module.fullname(), None)
+        if is_complete:
+            self.closures[module.fullname()] = (module, list(closure))
+        return list(closure), is_complete
 
 
 class AddSettingValuesToDjangoConfObject:
-    def __init__(self, settings_modules: List[str], ignore_missing_settings: bool):
+    def __init__(self, settings_modules: List[str], ignore_missing_settings: bool, lazy_settings: bool = False,
+                 import_star_closure: Optional[ImportStarClosure] = None):
         self.settings_modules = settings_modules
         self.ignore_missing_settings = ignore_missing_settings
+        self.lazy_settings = lazy_settings
+        self.import_star_closure = import_star_closure or ImportStarClosure()
 
     def __call__(self, ctx: ClassDefContext) -> None:
         api = cast(SemanticAnalyzerPass2, ctx.api)
         for module_name in self.settings_modules:
             module = api.modules[module_name]
             star_deps = [api.modules[star_dep]
-                         for star_dep in reversed(get_import_star_modules(api, module))]
-            load_settings_from_names(ctx.cls, modules=star_deps + [module], api=api)
+                         for star_dep in self.import_star_closure.get_closure(api.modules, module_name)]
+            if self.lazy_settings:
+                register_settings_names(ctx.cls, modules=star_deps + [module])
+            else:
+                load_settings_from_names(ctx.cls, modules=star_deps + [module], api=api)
+
+        if self.lazy_settings:
+            # settings are resolved by ExtractLazySettingType attribute hook on first access
+            str_type = api.named_type('__builtins__.str')
+            name_arg = Argument(variable=Var('name', str_type), type_annotation=str_type,
+                                initializer=None, kind=ARG_POS)
+            add_method(ctx, '__getattr__', [name_arg], AnyType(TypeOfAny.special_form))
+            return
 
         if self.ignore_missing_settings:
             ctx.cls.info.fallback_to_any = True
+
+
+class ExtractLazySettingType:
+    """
+    Type of setting registered by AddSettingValuesToDjangoConfObject in lazy mode, looked up
+    in the module defining it when settings.X is accessed for the first time.
+    """
+
+    def __init__(self, ignore_missing_settings: bool):
+        self.ignore_missing_settings = ignore_missing_settings
+        # setting name -> (defining module tree, setting type)
+        self.materialized: Dict[str, Tuple[MypyFile, Type]] = {}
+
+    def __call__(self, ctx: AttributeContext) -> Type:
+        api = cast(TypeChecker, ctx.api)
+        if not isinstance(ctx.context, MemberExpr) or not isinstance(ctx.type, Instance):
+            return ctx.default_attr_type
+
+        setting_name = ctx.context.name
+        module_fullname = get_settings_metadata(ctx.type.type).get(setting_name)
+        module = api.modules.get(module_fullname) if module_fullname else None
+        if module is None:
+            return self.missing_setting(ctx, setting_name)
+
+        cached = self.materialized.get(setting_name)
+        if cached is not None and cached[0] is module:
+            return cached[1]
+
+        sym = module.names.get(setting_name)
+        if sym is None or sym.type is None:
+            # not inferred yet, or unannotated
+            return AnyType(TypeOfAny.unannotated)
+        if get_setting_instance(sym.type) is None:
+            return self.missing_setting(ctx, setting_name)
+
+        self.materialized[setting_name] = (module, sym.type)
+        return sym.type
+
+    def missing_setting(self, ctx: AttributeContext, setting_name: str) -> Type:
+        if self.ignore_missing_settings:
+            return AnyType(TypeOfAny.special_form)
+        ctx.api.fail(f'"LazySettings" has no attribute "{setting_name}"', ctx.context)
+        return AnyType(TypeOfAny.from_error)
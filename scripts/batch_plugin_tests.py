@@ -0,0 +1,284 @@
+"""
+Batched runner of plugin test cases from test-data/typecheck/*.test.
+
+pytest runs every [CASE] as a separate mypy build, which loads builtins, typing and django-stubs again
+for a few lines of code. Here cases with the same plugin configuration are typechecked together in one build,
+main module of every case renamed to main_<n>, and errors are split back to the cases by file. Builds are
+distributed over worker processes.
+
+Plugin state (apps registry, related fields, managers) is keyed by full names of models and modules, so models
+of different cases do not interfere: main_<n> is an app label of its own. Cases are batched only if their [file]s
+declare different top-level modules, as every module of a build is loaded whether a case imports it or not.
+Cases which refer to the "main" module by name in the code (model strings, schema files) are checked alone.
+--compare checks every case both batched and alone, and reports cases with different errors.
+
+This is a local tool, pytest is the runner of the suite in CI and the reference for results.
+
+    python ./scripts/batch_plugin_tests.py
+    python ./scripts/batch_plugin_tests.py test-data/typecheck/fields.test -k nullable -j 4
+    python ./scripts/batch_plugin_tests.py --compare
+"""
+import argparse
+import difflib
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from mypy import build
+from mypy.main import process_options
+
+PROJECT_DIRECTORY = Path(__file__).resolve().parent.parent
+TEST_FILES_DIRECTORY = PROJECT_DIRECTORY / 'test-data' / 'typecheck'
+MYPY_CONFIG_FPATH = PROJECT_DIRECTORY / 'test-data' / 'plugins.ini'
+
+# more cases in a batch make workers unbalanced at the end of the run
+DEFAULT_BATCH_SIZE = 30
+
+SECTION_HEADER_RE = re.compile(r'^\[(?P<kind>[a-z]+|CASE)(?: (?P<arg>.*))?\]$')
+EXPECTED_ERROR_COMMENT_RE = re.compile(r' # E: ')
+ERROR_LINE_RE = re.compile(r'^(?P<fname>[^:]+?)(?:\.pyi?)?:(?P<line>\d+): (?P<rest>.*)$')
+MAIN_MODULE_REFERENCE_RE = re.compile(r'[\'"]main\.')
+
+
+class TestCase(NamedTuple):
+    name: str
+    location: str
+    main: str
+    files: Dict[str, str]
+    env: Dict[str, str]
+    expected: List[str]
+
+    def is_batchable(self) -> bool:
+        code = '\n'.join([EXPECTED_ERROR_COMMENT_RE.split(line)[0]
+                          for content in [self.main, *self.files.values()] for line in content.splitlines()])
+        return MAIN_MODULE_REFERENCE_RE.search(code) is None
+
+    def get_top_level_modules(self) -> Set[str]:
+        return {Path(fname).parts[0].split('.')[0] for fname in self.files if re.search(r'\.pyi?$', fname)}
+
+    def get_config_key(self) -> Tuple[Tuple[str, str], ...]:
+        """Cases in one build share the plugin, which is configured by environment and mypy_django.ini"""
+        return (*sorted(self.env.items()), ('mypy_django.ini', self.files.get('mypy_django.ini', '')))
+
+
+class CaseResult(NamedTuple):
+    case: TestCase
+    errors: List[str]
+
+    @property
+    def passed(self) -> bool:
+        return sorted(self.errors) == sorted(self.case.expected)
+
+
+def get_expected_errors(main: str, files: Dict[str, str], out_lines: List[str]) -> List[str]:
+    """'# E: ' comments of main and [file]s, like pytest-mypy-plugins collects them, and the [out] section"""
+    expected = []
+    for fname, content in [('main.py', main), *files.items()]:
+        module_fname = re.sub(r'\.pyi?$', '', fname)
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            for message in EXPECTED_ERROR_COMMENT_RE.split(line)[1:]:
+                expected.append(f'{module_fname}:{line_number}: error: {message.strip()}')
+    return expected + [line for line in out_lines if line.strip()]
+
+
+def parse_test_file(fpath: Path) -> List[TestCase]:
+    cases = []
+    # (kind, argument, line number, content lines) of sections of the current case
+    sections: List[Tuple[str, Optional[str], int, List[str]]] = []
+
+    def add_case() -> None:
+        if not sections:
+            return
+        _, name, line_number, main_lines = sections[0]
+        files: Dict[str, str] = {}
+        env: Dict[str, str] = {}
+        out_lines: List[str] = []
+        for kind, arg, _, lines in sections[1:]:
+            if kind == 'file' and arg:
+                files[arg] = '\n'.join(lines).rstrip('\n') + '\n'
+            elif kind == 'env' and arg:
+                for definition in arg.split(';'):
+                    env_name, _, env_value = definition.partition('=')
+                    env[env_name] = env_value
+            elif kind == 'out':
+                out_lines.extend(lines)
+        main = '\n'.join(main_lines).rstrip('\n') + '\n'
+        cases.append(TestCase(name=name or '', location=f'{fpath}:{line_number}', main=main, files=files,
+                              env=env, expected=get_expected_errors(main, files, out_lines)))
+
+    for line_number, line in enumerate(fpath.read_text().splitlines(), start=1):
+        match = SECTION_HEADER_RE.match(line)
+        if match is None:
+            if sections:
+                # [[ escapes [ at the start of a line in the content
+                sections[-1][3].append(line[1:] if line.startswith('[[') else line)
+            continue
+        if match.group('kind') == 'CASE':
+            add_case()
+            sections = []
+        sections.append((match.group('kind'), match.group('arg'), line_number, []))
+    add_case()
+    return cases
+
+
+def make_batches(cases: List[TestCase], batch_size: int) -> List[List[TestCase]]:
+    batches: List[List[TestCase]] = []
+    open_batches: Dict[Tuple[Tuple[str, str], ...], List[List[TestCase]]] = {}
+    for case in cases:
+        if batch_size <= 1 or not case.is_batchable():
+            batches.append([case])
+            continue
+
+        for batch in open_batches.setdefault(case.get_config_key(), []):
+            # modules of other cases are a part of the build: imported or not, and declared as a package
+            # or a module, they have to be the same as when the case is checked alone
+            if (len(batch) < batch_size
+                    and all(not other.get_top_level_modules() & case.get_top_level_modules()
+                            and all(other.files.get(fname, content) == content
+                                    for fname, content in case.files.items())
+                            for other in batch)):
+                batch.append(case)
+                break
+        else:
+            batch = [case]
+            open_batches[case.get_config_key()].append(batch)
+            batches.append(batch)
+    return batches
+
+
+def get_main_module_name(batch: List[TestCase], index: int) -> str:
+    return 'main' if len(batch) == 1 else f'main_{index}'
+
+
+def split_errors(batch: List[TestCase], error_lines: List[str]) -> List[CaseResult]:
+    results = [CaseResult(case, []) for case in batch]
+    main_modules = {get_main_module_name(batch, index): index for index in range(len(batch))}
+    for error_line in error_lines:
+        match = ERROR_LINE_RE.match(error_line)
+        if match is None:
+            continue
+        fname = match.group('fname')
+        if fname in main_modules:
+            index = main_modules[fname]
+            main_module_re = re.compile(rf'\b{get_main_module_name(batch, index)}\b')
+            rest = main_module_re.sub('main', match.group('rest'))
+            results[index].errors.append(f'main:{match.group("line")}: {rest}')
+            continue
+
+        # errors in shared files belong to every case which declares the file, errors in stubs to all of them
+        declaring = [result for result in results
+                     if fname + '.py' in result.case.files or fname + '.pyi' in result.case.files]
+        for result in declaring or results:
+            result.errors.append(f'{fname}:{match.group("line")}: {match.group("rest")}')
+    return results
+
+
+def typecheck_batch(batch: List[TestCase]) -> List[CaseResult]:
+    prev_cwd = os.getcwd()
+    prev_environ = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        main_fnames = []
+        for index, case in enumerate(batch):
+            main_fname = get_main_module_name(batch, index) + '.py'
+            with open(os.path.join(tmp_directory, main_fname), 'w') as main_file:
+                main_file.write(case.main)
+            main_fnames.append(main_fname)
+            for fname, content in case.files.items():
+                fpath = os.path.join(tmp_directory, fname)
+                os.makedirs(os.path.dirname(fpath), exist_ok=True)
+                with open(fpath, 'w') as file:
+                    file.write(content)
+        # cases in a batch have the same environment
+        for env_name, env_value in batch[0].env.items():
+            os.environ[env_name] = env_value.replace('${MYPY_CWD}', tmp_directory)
+
+        os.chdir(tmp_directory)
+        try:
+            sources, options = process_options(['--config-file', str(MYPY_CONFIG_FPATH),
+                                                '--no-incremental', '--cache-dir', os.devnull,
+                                                '--show-traceback', *main_fnames])
+            try:
+                error_lines = build.build(sources, options).errors
+            except build.CompileError as exc:
+                error_lines = exc.messages
+        finally:
+            os.chdir(prev_cwd)
+            os.environ.clear()
+            os.environ.update(prev_environ)
+    return split_errors(batch, error_lines)
+
+
+def report_case_result(result: CaseResult) -> None:
+    print(f'FAILED {result.case.name} ({result.case.location})')
+    for line in difflib.unified_diff(sorted(result.case.expected), sorted(result.errors),
+                                     fromfile='expected', tofile='actual', lineterm=''):
+        print('    ' + line)
+
+
+def typecheck_cases(cases: List[TestCase], batch_size: int, jobs: int) -> List[CaseResult]:
+    started_at = time.perf_counter()
+    batches = make_batches(cases, batch_size)
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(typecheck_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            results.extend(future.result())
+
+    failed = [result for result in results if not result.passed]
+    print(f'{len(cases) - len(failed)} passed, {len(failed)} failed in {len(batches)} builds '
+          f'with {jobs} workers, {time.perf_counter() - started_at:.1f}s')
+    return results
+
+
+def run_cases(cases: List[TestCase], batch_size: int, jobs: int) -> int:
+    results = typecheck_cases(cases, batch_size, jobs)
+    failed = 0
+    for result in sorted(results, key=lambda result: result.case.location):
+        if not result.passed:
+            failed += 1
+            report_case_result(result)
+    return int(bool(failed))
+
+
+def compare_batching(cases: List[TestCase], batch_size: int, jobs: int) -> int:
+    """Errors of every case have to be the same when it is typechecked in a batch and alone"""
+    batched_errors = {result.case.location: sorted(result.errors)
+                      for result in typecheck_cases(cases, batch_size, jobs)}
+    different = 0
+    for result in sorted(typecheck_cases(cases, 1, jobs), key=lambda result: result.case.location):
+        if batched_errors[result.case.location] != sorted(result.errors):
+            different += 1
+            print(f'DIFFERENT {result.case.name} ({result.case.location})')
+            for line in difflib.unified_diff(sorted(result.errors), batched_errors[result.case.location],
+                                             fromfile='alone', tofile='batched', lineterm=''):
+                print('    ' + line)
+    print(f'{len(cases) - different} cases with the same errors batched and alone, {different} different')
+    return int(bool(different))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run plugin test cases batched into a few mypy builds')
+    parser.add_argument('test_files', nargs='*', type=Path,
+                        default=sorted(TEST_FILES_DIRECTORY.glob('*.test')))
+    parser.add_argument('-k', dest='keyword', default=None,
+                        help='only run cases with names containing the substring')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='maximum number of cases typechecked in one build')
+    parser.add_argument('--no-batch', action='store_true',
+                        help='typecheck every case in its own build, like pytest does')
+    parser.add_argument('--compare', action='store_true',
+                        help='typecheck cases both batched and alone, and report cases with different errors')
+    args = parser.parse_args()
+
+    cases = [case for fpath in args.test_files for case in parse_test_file(fpath)
+             if args.keyword is None or args.keyword in case.name]
+    if args.compare:
+        sys.exit(compare_batching(cases, batch_size=args.batch_size, jobs=args.jobs))
+    sys.exit(run_cases(cases, batch_size=1 if args.no_batch else args.batch_size, jobs=args.jobs))
@@ -0,0 +1,244 @@
+"""
+Benchmark of mypy_django_plugin on generated Django projects.
+
+Generates a project with configurable number of apps, models, fields, relations, managers and settings modules,
+typechecks it with and without the plugin in a fresh process, and appends wall time and peak RSS to a JSON file.
+Time spent inside plugin hooks and hit ratios of plugin caches are measured by a separate run with the hooks
+profiler, as profiling slows the build down. Results of two runs could be compared with --compare.
+
+    python ./scripts/benchmark_plugin.py --apps 20 --models 30 --output benchmarks.json
+    python ./scripts/benchmark_plugin.py --compare baseline.json benchmarks.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dataclasses import asdict, dataclass
+from mypy.version import __version__ as mypy_version
+
+PROJECT_DIRECTORY = Path(__file__).parent.parent
+
+# runs in a fresh interpreter, so that peak RSS belongs to a single mypy build
+MEASURE_MYPY_RUN = textwrap.dedent('''
+    import json, resource, sys, time
+    from mypy import api
+
+    started_at = time.perf_counter()
+    stdout, stderr, exit_status = api.run(sys.argv[1:])
+    elapsed = time.perf_counter() - started_at
+    if stderr:
+        print(stderr, file=sys.stderr)
+    print(json.dumps({'wall_time': elapsed,
+                      'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      'errors': len([line for line in stdout.splitlines() if ': error:' in line])}))
+''')
+
+
+@dataclass
+class ProjectShape:
+    apps: int = 10
+    models: int = 20
+    fields: int = 10
+    foreign_keys: int = 2
+    many_to_many: int = 1
+    managers: int = 1
+    settings_modules: int = 3
+    # Model(...) and Manager.create(...) calls per model in usage modules
+    constructor_calls: int = 3
+    seed: int = 0
+
+
+def generate_settings(root: Path, shape: ProjectShape) -> str:
+    settings_package = root / 'project_settings'
+    settings_package.mkdir()
+    (settings_package / '__init__.py').write_text('')
+
+    installed_apps = ', '.join(f"'app{i}'" for i in range(shape.apps))
+    (settings_package / 'base.py').write_text(f'INSTALLED_APPS = [{installed_apps}]\n'
+                                              f"AUTH_USER_MODEL = 'app0.Model0'\n"
+                                              f"SECRET_KEY = 'benchmark'\n")
+    previous = 'base'
+    for i in range(shape.settings_modules - 1):
+        module_name = f'layer{i}'
+        (settings_package / f'{module_name}.py').write_text(f'from .{previous} import *\n'
+                                                            f'SETTING_{i} = {i}\n'
+                                                            f'SETTING_LIST_{i} = ["{i}"]\n')
+        previous = module_name
+    return f'project_settings.{previous}'
+
+
+def generate_models_module(app_index: int, shape: ProjectShape, rnd: random.Random) -> str:
+    lines = ['from django.db import models', '']
+    for manager_index in range(shape.managers):
+        lines += [f'class Manager{manager_index}(models.Manager):',
+                  f'    pass',
+                  '']
+
+    for model_index in range(shape.models):
+        lines.append(f'class Model{model_index}(models.Model):')
+        for field_index in range(shape.fields):
+            if field_index % 3 == 0:
+                is_nullable = rnd.random() < 0.3
+                lines.append(f'    char_field{field_index} = models.CharField(max_length=100, null={is_nullable})')
+            elif field_index % 3 == 1:
+                lines.append(f'    int_field{field_index} = models.IntegerField(default=0)')
+            else:
+                lines.append(f'    date_field{field_index} = models.DateTimeField(blank=True)')
+
+        # relations point to earlier models of the same app, or to models of earlier apps by string
+        for fk_index in range(shape.foreign_keys):
+            if model_index > 0 and (app_index == 0 or rnd.random() < 0.5):
+                to = f'Model{rnd.randrange(model_index)}'
+            elif app_index > 0:
+                to = f"'app{rnd.randrange(app_index)}.Model{rnd.randrange(shape.models)}'"
+            else:
+                continue
+            lines.append(f'    fk{fk_index} = models.ForeignKey({to}, on_delete=models.CASCADE, '
+                         f"related_name='app{app_index}_model{model_index}_fk{fk_index}')")
+        for m2m_index in range(shape.many_to_many):
+            if model_index == 0:
+                continue
+            lines.append(f'    m2m{m2m_index} = models.ManyToManyField(Model{rnd.randrange(model_index)}, '
+                         f"related_name='app{app_index}_model{model_index}_m2m{m2m_index}')")
+        for manager_index in range(shape.managers):
+            lines.append(f'    manager{manager_index} = Manager{manager_index}()')
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_usage_module(app_index: int, shape: ProjectShape) -> str:
+    # models with custom managers have no implicit "objects"
+    manager_name = 'manager0' if shape.managers else 'objects'
+    lines = ['from django.conf import settings',
+             'from django.contrib.auth import get_user_model',
+             f'from app{app_index}.models import *',
+             '',
+             'def use_models() -> None:',
+             '    user_model = get_user_model()',
+             '    debug = settings.DEBUG',
+             '    installed_apps = settings.INSTALLED_APPS']
+    for model_index in range(shape.models):
+        for _ in range(shape.constructor_calls):
+            lines.append(f'    instance{model_index} = Model{model_index}(id=1)')
+            lines.append(f'    Model{model_index}.{manager_name}.create(id=1)')
+        lines.append(f'    instance{model_index}.pk')
+        if shape.foreign_keys and model_index > 0:
+            lines.append(f'    instance{model_index}.fk0_id')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_project(root: Path, shape: ProjectShape) -> str:
+    """Write project to root, return settings module name"""
+    rnd = random.Random(shape.seed)
+    settings_module = generate_settings(root, shape)
+    for app_index in range(shape.apps):
+        app_directory = root / f'app{app_index}'
+        app_directory.mkdir()
+        (app_directory / '__init__.py').write_text('')
+        (app_directory / 'models.py').write_text(generate_models_module(app_index, shape, rnd))
+        (app_directory / 'usage.py').write_text(generate_usage_module(app_index, shape))
+    return settings_module
+
+
+def run_mypy(root: Path, settings_module: str, with_plugin: bool,
+             profile_report_path: Optional[Path] = None) -> Dict[str, Any]:
+    config_file = root / ('with_plugin.ini' if with_plugin else 'without_plugin.ini')
+    config = '[mypy]\nincremental = False\nstrict_optional = True\n'
+    if with_plugin:
+        config += 'plugins =\n    mypy_django_plugin.main\n'
+    config_file.write_text(config)
+
+    env = dict(os.environ,
+               DJANGO_SETTINGS_MODULE=settings_module,
+               MYPY_DJANGO_CONFIG=str(root / 'missing_mypy_django.ini'),
+               PYTHONPATH=os.pathsep.join([str(PROJECT_DIRECTORY), os.environ.get('PYTHONPATH', '')]))
+    env.pop('MYPY_DJANGO_PROFILE', None)
+    if profile_report_path is not None:
+        env['MYPY_DJANGO_PROFILE'] = str(profile_report_path)
+    app_directories = sorted(str(path.name) for path in root.iterdir() if path.name.startswith('app'))
+    output = subprocess.run([sys.executable, '-c', MEASURE_MYPY_RUN,
+                             '--config-file', str(config_file), '--cache-dir', os.devnull,
+                             *app_directories],
+                            cwd=str(root), env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(output.stdout.decode().splitlines()[-1])
+
+
+def get_current_commit() -> str:
+    output = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=str(PROJECT_DIRECTORY),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return output.stdout.decode().strip()
+
+
+def run_benchmark(shape: ProjectShape) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as root_directory:
+        root = Path(root_directory)
+        settings_module = generate_project(root, shape)
+        without_plugin = run_mypy(root, settings_module, with_plugin=False)
+        with_plugin = run_mypy(root, settings_module, with_plugin=True)
+        profile_report_path = root / 'hooks_profile'
+        run_mypy(root, settings_module, with_plugin=True, profile_report_path=profile_report_path)
+        profile = json.loads(profile_report_path.with_suffix('.json').read_text())
+
+    hooks_time = sum(hook_stats['total_time'] for hook_stats in profile['hooks'].values())
+    return {
+        'shape': asdict(shape),
+        'mypy_version': mypy_version,
+        'commit': get_current_commit(),
+        'without_plugin': without_plugin,
+        'with_plugin': with_plugin,
+        # wall time difference of the two builds, includes analysis of modules only the plugin adds to the build
+        'plugin_overhead': max(with_plugin['wall_time'] - without_plugin['wall_time'], 0.0),
+        # measured inside plugin hooks, in the profiled build
+        'hooks_time': hooks_time,
+        'hooks': {name: {'calls': hook_stats['calls'], 'total_time': hook_stats['total_time']}
+                  for name, hook_stats in profile['hooks'].items()},
+        'caches': profile['caches'],
+    }
+
+
+def load_results(fpath: Path) -> List[Dict[str, Any]]:
+    if not fpath.exists():
+        return []
+    return json.loads(fpath.read_text())
+
+
+def compare_results(baseline_fpath: Path, current_fpath: Path) -> None:
+    baseline = {json.dumps(result['shape'], sort_keys=True): result for result in load_results(baseline_fpath)}
+    for result in load_results(current_fpath):
+        base_result = baseline.get(json.dumps(result['shape'], sort_keys=True))
+        if base_result is None:
+            continue
+        time_ratio = result['with_plugin']['wall_time'] / base_result['with_plugin']['wall_time']
+        rss_ratio = result['with_plugin']['peak_rss_kb'] / base_result['with_plugin']['peak_rss_kb']
+        print(f"{result['shape']}: wall time x{time_ratio:.2f}, peak RSS x{rss_ratio:.2f}, "
+              f"time in hooks {base_result['hooks_time']:.2f}s -> {result['hooks_time']:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark mypy_django_plugin on a generated Django project')
+    for field_name, default in asdict(ProjectShape()).items():
+        parser.add_argument('--' + field_name.replace('_', '-'), type=int, default=default)
+    parser.add_argument('--output', type=Path, default=Path('benchmarks.json'),
+                        help='JSON file results are appended to')
+    parser.add_argument('--compare', nargs=2, type=Path, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two results files instead of running benchmark')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        sys.exit(0)
+
+    shape = ProjectShape(**{field_name: getattr(args, field_name) for field_name in asdict(ProjectShape())})
+    result = run_benchmark(shape)
+    print(json.dumps(result, indent=2))
+
+    results = load_results(args.output)
+    results.append(result)
+    args.output.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,193 @@
+"""
+Transitive closure of django-stubs modules loaded by mypy for common entry imports, and the time it takes
+mypy to process it.
+
+Closure is computed the same way mypy follows imports: every imported module, every module imported
+with `from package import submodule`, and all parent packages of those. Sizes are checked against
+the budget in scripts/stubs_budget.json with --check-budget, to catch stub changes which make
+small projects load much more of django-stubs.
+
+    python ./scripts/stubs_import_graph.py
+    python ./scripts/stubs_import_graph.py --timing
+    python ./scripts/stubs_import_graph.py --check-budget
+    python ./scripts/stubs_import_graph.py --why django.db.models.sql.compiler django.http
+"""
+import argparse
+import ast
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+PROJECT_DIRECTORY = Path(__file__).parent.parent
+STUBS_DIRECTORY = PROJECT_DIRECTORY / 'django-stubs'
+BUDGET_FPATH = Path(__file__).parent / 'stubs_budget.json'
+
+ENTRY_IMPORTS = [
+    'django.conf',
+    'django.db.models',
+    'django.http',
+    'django.shortcuts',
+    'django.urls',
+    'django.views.generic',
+    'django.contrib.auth',
+    'django.contrib.admin',
+    'django.test',
+    'django.forms',
+    'django.template',
+    'django.core.exceptions',
+    'django.utils.translation',
+]
+
+
+def find_stub_files(stubs_directory: Path) -> Dict[str, Path]:
+    modules = {}
+    for fpath in stubs_directory.glob('**/*.pyi'):
+        parts = list(fpath.relative_to(stubs_directory).with_suffix('').parts)
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        modules['.'.join(['django'] + parts)] = fpath
+    return modules
+
+
+def get_ancestors(module_name: str) -> List[str]:
+    parts = module_name.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+def resolve_relative_import(module_name: str, is_package: bool, level: int, imported: Optional[str]) -> str:
+    parts = module_name.split('.')
+    if not is_package:
+        parts = parts[:-1]
+    if level > 1:
+        parts = parts[:-(level - 1)]
+    if imported:
+        parts.append(imported)
+    return '.'.join(parts)
+
+
+def get_module_imports(module_name: str, fpath: Path, modules: Dict[str, Path]) -> Set[str]:
+    is_package = fpath.name == '__init__.pyi'
+    imports = set()
+    for node in ast.walk(ast.parse(fpath.read_text(), str(fpath))):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                imported_module = resolve_relative_import(module_name, is_package, node.level, node.module)
+            else:
+                imported_module = node.module or ''
+            imports.add(imported_module)
+            for alias in node.names:
+                # from package import submodule
+                if imported_module + '.' + alias.name in modules:
+                    imports.add(imported_module + '.' + alias.name)
+
+    dependencies = set()
+    for imported_module in imports:
+        for dependency in [*get_ancestors(imported_module), imported_module]:
+            if dependency in modules and dependency != module_name:
+                dependencies.add(dependency)
+    return dependencies
+
+
+class StubsImportGraph:
+    def __init__(self, stubs_directory: Path) -> None:
+        self.modules = find_stub_files(stubs_directory)
+        self.dependencies = {module_name: get_module_imports(module_name, fpath, self.modules)
+                             for module_name, fpath in self.modules.items()}
+
+    def get_closure(self, entry: str) -> Set[str]:
+        closure = set()
+        queue = [module for module in [*get_ancestors(entry), entry] if module in self.modules]
+        while queue:
+            module_name = queue.pop()
+            if module_name in closure:
+                continue
+            closure.add(module_name)
+            queue.extend(self.dependencies[module_name] - closure)
+        return closure
+
+    def get_closure_size(self, entry: str) -> int:
+        return sum(self.modules[module_name].stat().st_size for module_name in self.get_closure(entry))
+
+    def get_import_path(self, entry: str, target: str) -> Optional[List[str]]:
+        """Shortest chain of imports through which entry loads target"""
+        start = [module for module in [*get_ancestors(entry), entry] if module in self.modules]
+        previous: Dict[str, Optional[str]] = {module: None for module in start}
+        queue = list(start)
+        while queue:
+            module_name = queue.pop(0)
+            if module_name == target:
+                path = [module_name]
+                while previous[path[-1]] is not None:
+                    path.append(previous[path[-1]])
+                return list(reversed(path))
+            for dependency in sorted(self.dependencies[module_name]):
+                if dependency not in previous:
+                    previous[dependency] = module_name
+                    queue.append(dependency)
+        return None
+
+
+def measure_mypy_time(entry: Optional[str]) -> float:
+    from mypy import api
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        fpath = os.path.join(tmp_directory, 'entry.py')
+        with open(fpath, 'w') as entry_file:
+            entry_file.write(f'import {entry}\n' if entry else '')
+        started_at = time.perf_counter()
+        api.run(['--no-incremental', '--cache-dir', os.devnull, '--config-file', '', fpath])
+        return time.perf_counter() - started_at
+
+
+def load_budget() -> Dict[str, int]:
+    return json.loads(BUDGET_FPATH.read_text())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report django-stubs modules loaded for entry imports')
+    parser.add_argument('entries', nargs='*', default=ENTRY_IMPORTS)
+    parser.add_argument('--timing', action='store_true',
+                        help='also measure time of mypy run on a module with the single entry import')
+    parser.add_argument('--check-budget', action='store_true',
+                        help=f'exit with error if closure of any entry has more modules than in {BUDGET_FPATH.name}')
+    parser.add_argument('--update-budget', action='store_true',
+                        help=f'write current closure sizes to {BUDGET_FPATH.name}')
+    parser.add_argument('--why', metavar='MODULE',
+                        help='print import chain through which every entry loads MODULE')
+    args = parser.parse_args()
+
+    graph = StubsImportGraph(STUBS_DIRECTORY)
+    if args.why:
+        for entry in args.entries:
+            path = graph.get_import_path(entry, args.why)
+            print(f'{entry}: ' + (' -> '.join(path) if path else 'not loaded'))
+        sys.exit(0)
+
+    baseline_time = measure_mypy_time(None) if args.timing else 0.0
+    print(f'{"entry":<30} {"modules":>8} {"of":>5} {"KiB":>8}' + (f' {"time, s":>8}' if args.timing else ''))
+    closure_sizes = {}
+    for entry in args.entries:
+        closure_sizes[entry] = len(graph.get_closure(entry))
+        line = (f'{entry:<30} {closure_sizes[entry]:>8} {len(graph.modules):>5} '
+                f'{graph.get_closure_size(entry) / 1024:>8.1f}')
+        if args.timing:
+            line += f' {measure_mypy_time(entry) - baseline_time:>8.2f}'
+        print(line)
+
+    if args.update_budget:
+        BUDGET_FPATH.write_text(json.dumps(closure_sizes, indent=4, sort_keys=True) + '\n')
+
+    if args.check_budget:
+        over_budget = {entry: size for entry, size in closure_sizes.items()
+                       if entry in load_budget() and size > load_budget()[entry]}
+        for entry, size in over_budget.items():
+            print(f'{entry} loads {size} stub modules, budget is {load_budget()[entry]}. '
+                  f'Check new imports with --why, or run with --update-budget if the growth is intended',
+                  file=sys.stderr)
+        sys.exit(1 if over_budget else 0)
@@ -1,15 +1,32 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
 import re
+import shutil
 import sys
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Pattern
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Pattern, Set, Tuple, Union
 
-from git import Repo
+from git import GitCommandError, Repo
+import mypy
 from mypy import build
 from mypy.main import process_options
+from mypy.version import __version__ as mypy_version
 
 PROJECT_DIRECTORY = Path(__file__).parent.parent
+STUBS_DIRECTORY = PROJECT_DIRECTORY / 'django-stubs'
+PLUGIN_DIRECTORY = PROJECT_DIRECTORY / 'mypy_django_plugin'
+# typeshed is a part of mypy version
+MYPY_DIRECTORY = Path(mypy.__file__).parent
+
+# verdicts of previous runs, directory is not checked again until its key changes
+RESULTS_CACHE_FPATH = PROJECT_DIRECTORY / '.typecheck_tests_cache.json'
 
 # Django branch to typecheck against
 DJANGO_BRANCH = 'stable/2.1.x'
@@ -592,15 +609,60 @@ def cd(path):
         os.chdir(prev_cwd)
 
 
+def pattern_to_str(pattern: Union[str, Pattern]) -> str:
+    return pattern.pattern if isinstance(pattern, Pattern) else pattern
+
+
+def pattern_matches(pattern: Union[str, Pattern], line: str) -> bool:
+    if isinstance(pattern, Pattern):
+        return pattern.search(line) is not None
+    return pattern in line
+
+
+class IgnoredErrorsMatcher:
+    """All ignore patterns of a folder compiled into a single alternation regex"""
+
+    def __init__(self, patterns: List[Union[str, Pattern]]) -> None:
+        self.patterns = patterns
+        self.regex = re.compile('|'.join(f'(?P<pattern{i}>{pattern_to_str(pattern)})'
+                                         if isinstance(pattern, Pattern)
+                                         else f'(?P<pattern{i}>{re.escape(pattern)})'
+                                         for i, pattern in enumerate(patterns)))
+        self.used_patterns: Set[int] = set()
+        self.ignored_lines: List[str] = []
+
+    def is_ignored(self, line: str) -> bool:
+        match = self.regex.search(line)
+        if match is None:
+            return False
+        self.used_patterns.add(int(match.lastgroup[len('pattern'):]))
+        self.ignored_lines.append(line)
+        return True
+
+    def get_unused_patterns(self) -> List[str]:
+        unused = []
+        for i, pattern in enumerate(self.patterns):
+            if i in self.used_patterns:
+                continue
+            # only the leftmost pattern is credited for a line, check the rest separately
+            if any(pattern_matches(pattern, line) for line in self.ignored_lines):
+                continue
+            unused.append(pattern_to_str(pattern))
+        return unused
+
+
+_ignored_errors_matchers: Dict[str, IgnoredErrorsMatcher] = {}
+
+
+def get_ignored_errors_matcher(test_folder_name: str) -> IgnoredErrorsMatcher:
+    if test_folder_name not in _ignored_errors_matchers:
+        patterns = IGNORED_ERRORS['__common__'] + IGNORED_ERRORS.get(test_folder_name, [])
+        _ignored_errors_matchers[test_folder_name] = IgnoredErrorsMatcher(patterns)
+    return _ignored_errors_matchers[test_folder_name]
+
+
 def is_ignored(line: str, test_folder_name: str) -> bool:
-    for pattern in IGNORED_ERRORS['__common__'] + IGNORED_ERRORS.get(test_folder_name, []):
-        if isinstance(pattern, Pattern):
-            if pattern.search(line):
-                return True
-        else:
-            if pattern in line:
-                return True
-    return False
+    return get_ignored_errors_matcher(test_folder_name).is_ignored(line)
 
 
 def replace_with_clickable_location(error: str, abs_test_folder: Path) -> str:
@@ -617,40 +679,356 @@ def replace_with_clickable_location(error: str, abs_test_folder: Path) -> str:
     return error.replace(raw_path, clickable_location)
 
 
-def check_with_mypy(abs_path: Path, config_file_path: Path) -> int:
-    error_happened = False
+class CheckResult(NamedTuple):
+    abs_path: Path
+    errors: List[str]
+    elapsed: float
+    # computed only when unused ignores are reported
+    unused_ignores: Optional[List[str]]
+    # django-stubs files loaded for the directory, relative to STUBS_DIRECTORY
+    stub_files: List[str]
+    # other files loaded for the directory, absolute: its own modules, other test directories and helpers
+    source_files: List[str]
+    # django-stubs files defining names which modules of the directory refer to
+    referenced_stub_files: List[str]
+    key: str
+    cached: bool = False
+
+
+def update_hash(key_hash: Any, fpaths: Iterable[Path], root: Path) -> None:
+    for fpath in fpaths:
+        key_hash.update(str(fpath.relative_to(root)).encode())
+        key_hash.update(fpath.read_bytes() if fpath.is_file() else b'<missing>')
+
+
+def get_result_key(abs_path: Path, stub_files: List[str], source_files: List[str], config_file_path: Path) -> str:
+    """Hash of everything the verdict for the directory depends on"""
+    key_hash = hashlib.sha1(mypy_version.encode())
+    key_hash.update(config_file_path.read_bytes())
+    # plugin configuration, mypy runs in the checked directory
+    key_hash.update(os.environ.get('DJANGO_SETTINGS_MODULE', '<unset>').encode())
+    mypy_django_config_fpath = abs_path / os.environ.get('MYPY_DJANGO_CONFIG', 'mypy_django.ini')
+    key_hash.update(mypy_django_config_fpath.read_bytes() if mypy_django_config_fpath.is_file() else b'<missing>')
+    for pattern in IGNORED_ERRORS['__common__'] + IGNORED_ERRORS.get(abs_path.name, []):
+        key_hash.update(pattern_to_str(pattern).encode())
+    update_hash(key_hash, sorted(abs_path.glob('**/*.py')), abs_path)
+    update_hash(key_hash, sorted(PLUGIN_DIRECTORY.glob('**/*.py')), PLUGIN_DIRECTORY)
+    update_hash(key_hash, [STUBS_DIRECTORY / stub_file for stub_file in stub_files], STUBS_DIRECTORY)
+    update_hash(key_hash, [Path(source_file) for source_file in source_files], Path(abs_path.anchor))
+    return key_hash.hexdigest()
+
+
+def get_stub_file(path: str) -> Optional[str]:
+    # stubs could be loaded from site-packages, they are expected to be the same as in the checkout
+    parts = Path(path).parts
+    if 'django-stubs' not in parts:
+        return None
+    return str(Path(*parts[parts.index('django-stubs') + 1:]))
+
+
+def get_source_file(path: str) -> Optional[str]:
+    abs_path = Path(os.path.abspath(path))
+    if get_stub_file(path) is not None or MYPY_DIRECTORY in abs_path.parents:
+        return None
+    return str(abs_path)
+
+
+def get_referenced_stub_files(res: build.BuildResult, abs_path: Path) -> List[str]:
+    """
+    Stub files which modules of the directory depend on by names, according to fine-grained dependencies
+    mypy writes to the cache for every module: triggers of its names -> targets depending on them.
+    Loaded stubs are much wider, every directory importing django.db.models loads django.forms.widgets.
+    """
+    module_ids = {state.id for state in res.graph.values()
+                  if state.path and abs_path in Path(os.path.abspath(state.path)).parents}
+
+    def is_directory_target(target: str) -> bool:
+        return any(target == module_id or target.startswith(module_id + '.') for module_id in module_ids)
+
+    referenced_stub_files = []
+    for state in res.graph.values():
+        stub_file = get_stub_file(state.path) if state.path else None
+        if stub_file is None:
+            continue
+        _, _, deps_fname = build.get_cache_names(state.id, state.xpath, res.manager)
+        assert deps_fname is not None
+        try:
+            deps = json.loads(res.manager.metastore.read(deps_fname))
+        except FileNotFoundError:
+            continue
+        if any(is_directory_target(target) for targets in deps.values() for target in targets):
+            referenced_stub_files.append(stub_file)
+    return sorted(referenced_stub_files)
+
+
+def typecheck_directory(abs_path: Path, config_file_path: Path, cache_directory: Path,
+                        find_unused_ignores: bool = False) -> CheckResult:
+    """Typecheck Django tests directory, return not ignored errors and wall time spent"""
+    started_at = time.perf_counter()
+    errors = []
+
+    def flush_errors(new_messages: List[str], serious: bool) -> None:
+        # printed as soon as mypy finishes a module, not when the whole build is done
+        for error_line in new_messages:
+            if not is_ignored(error_line, abs_path.name):
+                error = replace_with_clickable_location(error_line, abs_test_folder=abs_path)
+                errors.append(error)
+                print(error, flush=True)
+
     with cd(abs_path):
-        sources, options = process_options(['--cache-dir', str(config_file_path.parent / '.mypy_cache'),
+        # fine-grained dependencies are written to the cache, to find referenced stubs
+        sources, options = process_options(['--cache-dir', str(cache_directory), '--cache-fine-grained',
                                             '--config-file', str(config_file_path),
                                             str(abs_path)])
-        res = build.build(sources, options)
-        for error_line in res.errors:
-            if not is_ignored(error_line, abs_path.name):
-                error_happened = True
-                print(replace_with_clickable_location(error_line, abs_test_folder=abs_path))
-    return int(error_happened)
+        res = build.build(sources, options, flush_errors=flush_errors)
+        paths = [state.path for state in res.graph.values() if state.path]
+        stub_files = sorted(filter(None, map(get_stub_file, paths)))
+        source_files = sorted(filter(None, map(get_source_file, paths)))
+        referenced_stub_files = get_referenced_stub_files(res, abs_path)
+    unused_ignores = None
+    if find_unused_ignores:
+        unused_ignores = get_ignored_errors_matcher(abs_path.name).get_unused_patterns()
+    return CheckResult(abs_path, errors, time.perf_counter() - started_at, unused_ignores,
+                       stub_files=stub_files, source_files=source_files, referenced_stub_files=referenced_stub_files,
+                       key=get_result_key(abs_path, stub_files, source_files, config_file_path))
 
 
-if __name__ == '__main__':
-    mypy_config_file = (PROJECT_DIRECTORY / 'scripts' / 'mypy.ini').absolute()
-    repo_directory = PROJECT_DIRECTORY / 'django-sources'
-    tests_root = repo_directory / 'tests'
-    global_rc = 0
+# cache directory of the worker process, mypy does not lock the cache against concurrent builds
+_worker_cache_directory: Optional[Path] = None
+
+
+def init_worker(cache_directories: Any, warm_cache_directory: Path) -> None:
+    global _worker_cache_directory
+    _worker_cache_directory = cache_directories.get()
+    if not _worker_cache_directory.exists() and warm_cache_directory.exists():
+        shutil.copytree(warm_cache_directory, _worker_cache_directory)
+
+
+def typecheck_directory_in_worker(abs_path: Path, config_file_path: Path,
+                                  find_unused_ignores: bool = False) -> CheckResult:
+    assert _worker_cache_directory is not None
+    return typecheck_directory(abs_path, config_file_path, _worker_cache_directory,
+                               find_unused_ignores=find_unused_ignores)
+
+
+def report_check_result(result: CheckResult) -> int:
+    if result.cached:
+        print(f'Skipped unchanged {result.abs_path}')
+        # errors of checked directories are already printed by the worker
+        for error in result.errors:
+            print(error)
+    else:
+        print(f'Checked {result.abs_path} in {result.elapsed:.1f}s')
+    return int(bool(result.errors))
+
+
+def load_results_cache() -> Dict[str, Dict[str, Any]]:
+    if not RESULTS_CACHE_FPATH.exists():
+        return {}
+    return json.loads(RESULTS_CACHE_FPATH.read_text())
+
+
+def save_results(results_cache: Dict[str, Dict[str, Any]], results: List[CheckResult]) -> None:
+    for result in results:
+        if result.cached:
+            continue
+        results_cache[str(result.abs_path)] = {'key': result.key,
+                                               'errors': result.errors,
+                                               'unused_ignores': result.unused_ignores,
+                                               'stub_files': result.stub_files,
+                                               'source_files': result.source_files,
+                                               'referenced_stub_files': result.referenced_stub_files}
+    RESULTS_CACHE_FPATH.write_text(json.dumps(results_cache, indent=1, sort_keys=True))
+
+
+def get_cached_result(results_cache: Dict[str, Dict[str, Any]], abs_path: Path,
+                      config_file_path: Path, find_unused_ignores: bool = False) -> Optional[CheckResult]:
+    cached = results_cache.get(str(abs_path))
+    if cached is None or 'referenced_stub_files' not in cached:
+        return None
+    if get_result_key(abs_path, cached['stub_files'], cached['source_files'], config_file_path) != cached['key']:
+        return None
+    if find_unused_ignores and cached['unused_ignores'] is None:
+        return None
+    return CheckResult(abs_path, cached['errors'], 0.0, cached['unused_ignores'],
+                       stub_files=cached['stub_files'], source_files=cached['source_files'],
+                       referenced_stub_files=cached['referenced_stub_files'], key=cached['key'], cached=True)
+
+
+def report_unused_ignores(results: List[CheckResult]) -> None:
+    common_patterns = {pattern_to_str(pattern) for pattern in IGNORED_ERRORS['__common__']}
+    unused_common = set(common_patterns)
+    for result in results:
+        assert result.unused_ignores is not None
+        unused_common &= set(result.unused_ignores)
+        unused_in_folder = [pattern for pattern in result.unused_ignores
+                            if pattern not in common_patterns]
+        for pattern in unused_in_folder:
+            print(f'Unused ignore pattern for {result.abs_path.name!r}: {pattern!r}')
+    for pattern in sorted(unused_common):
+        print(f'Unused common ignore pattern: {pattern!r}')
+
+
+def get_django_root(directory: Path) -> Optional[Path]:
+    """Directory with django package and tests, itself or one of its children"""
+    for candidate in [directory, *sorted(path for path in directory.iterdir() if path.is_dir())]:
+        if (candidate / 'django').is_dir() and (candidate / 'tests').is_dir():
+            return candidate
+    return None
+
+
+def extract_django_tarball(tarball_fpath: Path) -> Path:
+    """Extract release tarball once, into a directory keyed by its content hash"""
+    tarball_hash = hashlib.sha1(tarball_fpath.read_bytes()).hexdigest()
+    extract_to = PROJECT_DIRECTORY / 'django-sources-tarball' / tarball_hash
+    if not extract_to.exists():
+        # extracted under a temporary name, interrupted extraction is not reused by the next run
+        partial_extract_to = extract_to.with_name(tarball_hash + '.partial')
+        shutil.rmtree(partial_extract_to, ignore_errors=True)
+        with tarfile.open(tarball_fpath) as tarball:
+            tarball.extractall(partial_extract_to)
+        partial_extract_to.rename(extract_to)
+
+    django_root = get_django_root(extract_to)
+    if django_root is None:
+        raise ValueError(f'{tarball_fpath} is not a Django release tarball: '
+                         f'no directory with "django" and "tests" in it')
+    return django_root
+
+
+def prepare_django_sources(repo_directory: Path, django_sources: Optional[Path]) -> Path:
+    """Return root of Django checkout to typecheck, offline if django_sources is passed"""
+    if django_sources is not None:
+        if django_sources.is_dir():
+            return django_sources
+        return extract_django_tarball(django_sources)
 
     # clone Django repository, if it does not exist
     if not repo_directory.exists():
         repo = Repo.clone_from('https://github.com/django/django.git', repo_directory)
     else:
         repo = Repo(repo_directory)
+    try:
+        repo.git.checkout(DJANGO_COMMIT_SHA)
+    except GitCommandError:
+        # commit is not fetched yet
         repo.remotes['origin'].pull(DJANGO_BRANCH)
+        repo.git.checkout(DJANGO_COMMIT_SHA)
+    return repo_directory
+
+
+def get_changed_files(revision: str) -> List[Tuple[str, str]]:
+    """(status, path) of stubs and plugin files changed in the working tree since revision"""
+    diff = Repo(PROJECT_DIRECTORY).git.diff('--name-status', '--no-renames', revision, '--',
+                                            STUBS_DIRECTORY.name, PLUGIN_DIRECTORY.name)
+    changed_files = []
+    for line in diff.splitlines():
+        status, _, path = line.partition('\t')
+        changed_files.append((status, path))
+    return changed_files
+
+
+def get_affected_dirnames(tests_root: Path, dirnames: List[str], changed_files: List[Tuple[str, str]]) -> List[str]:
+    """
+    Directories which could be affected by the changed files, according to stub files defining names
+    they referred to in the previous run. Any change to the plugin, added or removed stubs, and directories
+    without recorded stub files make the directory affected.
+    """
+    changed_stubs = set()
+    for status, path in changed_files:
+        if not path.startswith(STUBS_DIRECTORY.name + '/') or status != 'M':
+            return dirnames
+        changed_stubs.add(path[len(STUBS_DIRECTORY.name) + 1:])
+
+    results_cache = load_results_cache()
+    affected = []
+    for dirname in dirnames:
+        cached = results_cache.get(str((tests_root / dirname).absolute()))
+        if cached is None or 'referenced_stub_files' not in cached \
+                or changed_stubs & set(cached['referenced_stub_files']):
+            affected.append(dirname)
+    return affected
+
+
+def check_directories(tests_root: Path, dirnames: List[str], config_file_path: Path, jobs: int,
+                      show_unused_ignores: bool = False, use_results_cache: bool = True) -> int:
+    global_rc = 0
+    results_cache = load_results_cache()
+    results = []
+    abs_paths = []
+    for dirname in dirnames:
+        abs_path = (tests_root / dirname).absolute()
+        cached_result = (get_cached_result(results_cache, abs_path, config_file_path,
+                                           find_unused_ignores=show_unused_ignores)
+                         if use_results_cache else None)
+        if cached_result is not None:
+            results.append(cached_result)
+            global_rc |= report_check_result(cached_result)
+        else:
+            abs_paths.append(abs_path)
+    if not abs_paths:
+        return global_rc
 
-    repo.git.checkout(DJANGO_COMMIT_SHA)
-    for dirname in TESTS_DIRS:
-        abs_path = (PROJECT_DIRECTORY / tests_root / dirname).absolute()
-        print(f'Checking {abs_path}')
+    mypy_cache_directory = config_file_path.parent / '.mypy_cache'
+    cache_directories: Any = multiprocessing.Queue()
+    for worker_index in range(jobs):
+        cache_directories.put(mypy_cache_directory / f'worker-{worker_index}')
+    try:
+        # first directory is checked alone to populate mypy cache for the stubs, workers start
+        # with a copy of it, as every worker writes to its own cache directory
+        results.append(typecheck_directory(abs_paths[0], config_file_path, mypy_cache_directory / 'main',
+                                           find_unused_ignores=show_unused_ignores))
+        global_rc |= report_check_result(results[-1])
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(cache_directories, mypy_cache_directory / 'main')) as executor:
+            futures = [executor.submit(typecheck_directory_in_worker, abs_path, config_file_path,
+                                       show_unused_ignores)
+                       for abs_path in abs_paths[1:]]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                global_rc |= report_check_result(result)
+    finally:
+        # written once, verdicts of directories checked before an interruption are kept
+        save_results(results_cache, results)
+
+    if show_unused_ignores:
+        report_unused_ignores(results)
+    return global_rc
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Typecheck Django test suite with django-stubs')
+    parser.add_argument('--django-sources', type=Path, default=None,
+                        help='local Django checkout or release tarball, no network access is needed then')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes')
+    parser.add_argument('--report-unused-ignores', action='store_true',
+                        help='list IGNORED_ERRORS patterns which did not match any error')
+    parser.add_argument('--no-results-cache', action='store_true',
+                        help=f'check all directories, even unchanged since the previous run '
+                             f'(verdicts are cached in {RESULTS_CACHE_FPATH.name})')
+    parser.add_argument('--changed-since', metavar='REVISION', default=None,
+                        help='only check directories which referred to names of stubs changed since the git revision, '
+                             'as recorded by previous runs')
+    parser.add_argument('--list-affected', action='store_true',
+                        help='print directories affected by --changed-since instead of checking them')
+    parser.add_argument('dirnames', nargs='*', default=TESTS_DIRS,
+                        help='test directories to check, all of TESTS_DIRS by default')
+    args = parser.parse_args()
+
+    mypy_config_file = (PROJECT_DIRECTORY / 'scripts' / 'mypy.ini').absolute()
+    django_root = prepare_django_sources(PROJECT_DIRECTORY / 'django-sources', args.django_sources)
+    tests_root = django_root / 'tests'
 
-        rc = check_with_mypy(abs_path, mypy_config_file)
-        if rc != 0:
-            global_rc = 1
+    dirnames = args.dirnames
+    if args.changed_since is not None:
+        dirnames = get_affected_dirnames(tests_root, dirnames, get_changed_files(args.changed_since))
+    if args.list_affected:
+        print('\n'.join(dirnames))
+        sys.exit(0)
 
-    sys.exit(global_rc)
+    sys.exit(check_directories(tests_root, dirnames, mypy_config_file, jobs=args.jobs,
+                               show_unused_ignores=args.report_unused_ignores,
+                               use_results_cache=not args.no_results_cache))
@@ -0,0 +1,203 @@
+"""
+Plugin behaviour across incremental runs and fine-grained (daemon) updates, which .test cases can't cover:
+every case is a single mypy run, and cache of the case modules is dropped after it (--mypy-no-cache).
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from mypy import api, build
+from mypy.fscache import FileSystemCache
+from mypy.main import process_options
+from mypy.server.update import FineGrainedBuildManager
+
+PLUGINS_INI_FPATH = Path(__file__).parent / 'plugins.ini'
+
+
+def write_files(root: Path, files: Dict[str, str]) -> None:
+    for fname, content in files.items():
+        fpath = root / fname
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(content)
+
+
+def get_mypy_args(root: Path, *options: str) -> List[str]:
+    return ['--config-file', str(PLUGINS_INI_FPATH), '--no-silence-site-packages', '--show-traceback',
+            '--cache-dir', str(root / '.mypy_cache'), *options, 'main.py', 'b/models.py']
+
+
+def run_mypy(root: Path, *options: str) -> List[str]:
+    stdout, stderr, _ = api.run(get_mypy_args(root, *options))
+    assert not stderr, stderr
+    return stdout.splitlines()
+
+
+def run_mypy_process(root: Path) -> List[str]:
+    """In a separate process, which calls atexit handlers"""
+    process = subprocess.run([sys.executable, '-m', 'mypy', *get_mypy_args(root)],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert not process.stderr, process.stderr.decode()
+    return process.stdout.decode().splitlines()
+
+
+MODELS_FILES = {
+    'a/__init__.py': '',
+    'a/models.py': 'from django.db import models\n'
+                   'class Publisher(models.Model):\n'
+                   '    pass\n',
+    'b/__init__.py': '',
+    'b/models.py': 'from django.db import models\n'
+                   'from a.models import Publisher\n'
+                   'class Book(models.Model):\n'
+                   '    publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)\n',
+    'main.py': 'from a.models import Publisher\n'
+               'reveal_type(Publisher().book_set)\n',
+}
+
+
+def test_reverse_relations_are_kept_when_referenced_model_module_is_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, MODELS_FILES)
+    expected = ["main.py:2: error: Revealed type is 'django.db.models.manager.RelatedManager[b.models.Book]'"]
+    assert run_mypy(tmp_path) == expected
+
+    write_files(tmp_path, {'a/models.py': MODELS_FILES['a/models.py']
+                                          + '    name = models.CharField(max_length=100)\n'})
+    assert run_mypy(tmp_path) == expected
+
+    # modules with errors are not cached, main is checked against models loaded from the cache
+    assert run_mypy(tmp_path) == expected
+
+
+@pytest.mark.parametrize('cache_options', [[], ['--sqlite-cache']])
+def test_cached_referenced_model_module_is_loaded_after_related_field_module(tmp_path, monkeypatch, cache_options):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, MODELS_FILES)
+    expected = ["main.py:2: error: Revealed type is 'django.db.models.manager.RelatedManager[b.models.Book]'"]
+    assert run_mypy(tmp_path, *cache_options) == expected
+
+    # models modules are loaded from the cache, type of Publisher.book_set refers to b.models
+    for line_number in [3, 4]:
+        main = MODELS_FILES['main.py'] + 'reveal_type(Publisher().book_set)\n' * (line_number - 2)
+        write_files(tmp_path, {'main.py': main})
+        expected.append(expected[0].replace('main.py:2', f'main.py:{line_number}'))
+        assert run_mypy(tmp_path, *cache_options) == expected
+
+
+def test_referenced_model_module_does_not_depend_on_related_field_module(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, MODELS_FILES)
+    run_mypy(tmp_path)
+
+    # modules declaring related fields import the referenced one, they would be in one SCC otherwise
+    python_version_dir = '.'.join(str(part) for part in sys.version_info[:2])
+    meta = json.loads((tmp_path / '.mypy_cache' / python_version_dir / 'a' / 'models.meta.json').read_text())
+    assert 'b.models' not in meta['dependencies']
+
+
+def test_reverse_relations_are_updated_when_related_field_module_is_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, MODELS_FILES)
+    run_mypy(tmp_path)
+
+    write_files(tmp_path, {
+        'b/models.py': MODELS_FILES['b/models.py'].replace('models.CASCADE', "models.CASCADE, related_name='books'"),
+        'main.py': MODELS_FILES['main.py'].replace('book_set', 'books'),
+    })
+    assert run_mypy(tmp_path) == [
+        "main.py:2: error: Revealed type is 'django.db.models.manager.RelatedManager[b.models.Book]'",
+    ]
+
+
+def test_model_schema_export_keeps_models_loaded_from_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, {**MODELS_FILES,
+                           'mypy_django.ini': '[mypy_django_plugin]\nmodel_schema_export = models_schema.json\n'})
+    monkeypatch.setenv('MYPY_DJANGO_CONFIG', str(tmp_path / 'mypy_django.ini'))
+    expected_publisher_schema = {
+        'app_label': 'a',
+        'reverse_relations': {'book_set': {'model': 'b.models.Book', 'field': 'publisher', 'kind': 'ForeignKey'}},
+    }
+    run_mypy_process(tmp_path)
+    schema_fpath = tmp_path / 'models_schema.json'
+    schema = json.loads(schema_fpath.read_text())
+    assert schema['models']['a.models.Publisher'] == expected_publisher_schema
+
+    # models modules are loaded from the cache, on mypy<0.750 after the cache is written once more
+    # with dependencies between models modules
+    run_mypy_process(tmp_path)
+    written_at = schema_fpath.stat().st_mtime_ns
+    write_files(tmp_path, {'main.py': MODELS_FILES['main.py'] + 'reveal_type(Publisher())\n'})
+    assert run_mypy_process(tmp_path)[-1] == "main.py:3: error: Revealed type is 'a.models.Publisher'"
+    schema = json.loads(schema_fpath.read_text())
+    assert schema['models']['a.models.Publisher'] == expected_publisher_schema
+    # file is not written, when none of the entries changed
+    assert schema_fpath.stat().st_mtime_ns == written_at
+
+
+SETTINGS_FILES = {
+    'mysettings.py': 'MY_SETTING: int = 1\n'
+                     'NUMBERS = [1, 2]\n',
+    'mypy_django.ini': '[mypy_django_plugin]\n'
+                       'django_settings = mysettings\n',
+    'main.py': 'from django.conf import settings\n'
+               'reveal_type(settings.MY_SETTING)\n'
+               'reveal_type(settings.NUMBERS)\n',
+}
+
+
+def test_settings_are_typed_when_django_conf_is_loaded_from_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, {**MODELS_FILES, **SETTINGS_FILES})
+    monkeypatch.setenv('MYPY_DJANGO_CONFIG', str(tmp_path / 'mypy_django.ini'))
+    expected = ["main.py:2: error: Revealed type is 'builtins.int'",
+                "main.py:3: error: Revealed type is 'builtins.list[builtins.int]'"]
+    assert run_mypy(tmp_path) == expected
+    assert run_mypy(tmp_path) == expected
+
+
+def test_cache_of_modules_outside_of_build_is_dropped_when_settings_configuration_is_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, {**MODELS_FILES, **SETTINGS_FILES,
+                           'other_mypy_django.ini': '[mypy_django_plugin]\nignore_missing_settings = True\n'})
+    monkeypatch.setenv('MYPY_DJANGO_CONFIG', str(tmp_path / 'mypy_django.ini'))
+    run_mypy(tmp_path)
+
+    # django.conf is not a part of the next build, its cache still depends on mysettings
+    monkeypatch.setenv('MYPY_DJANGO_CONFIG', str(tmp_path / 'other_mypy_django.ini'))
+    write_files(tmp_path, {'main.py': MODELS_FILES['main.py']})
+    run_mypy(tmp_path)
+
+    (tmp_path / 'mysettings.py').unlink()
+    write_files(tmp_path, {'main.py': 'from django.conf import settings\n'
+                                      'reveal_type(settings.DEBUG)\n'})
+    assert run_mypy(tmp_path) == ["main.py:2: error: Revealed type is 'builtins.bool'"]
+
+
+def test_reverse_relations_are_updated_in_fine_grained_mode_when_related_name_is_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, MODELS_FILES)
+    fscache = FileSystemCache()
+    sources, options = process_options(['--config-file', str(PLUGINS_INI_FPATH), '--no-silence-site-packages',
+                                        '--show-traceback', '--cache-dir', os.devnull,
+                                        'main.py', 'a/models.py', 'b/models.py'], fscache=fscache)
+    options.incremental = False
+    options.fine_grained_incremental = True
+    result = build.build(sources, options, fscache=fscache)
+    assert result.errors == [
+        "main.py:2: error: Revealed type is 'django.db.models.manager.RelatedManager[b.models.Book]'",
+    ]
+    fine_grained_manager = FineGrainedBuildManager(result)
+
+    write_files(tmp_path, {
+        'b/models.py': MODELS_FILES['b/models.py'].replace('models.CASCADE', "models.CASCADE, related_name='books'"),
+        'main.py': MODELS_FILES['main.py'].replace('book_set', 'books'),
+    })
+    fscache.flush()
+    # same field type, only the related manager of Publisher is renamed
+    errors = fine_grained_manager.update([('b.models', 'b/models.py'), ('main', 'main.py')], [])
+    assert errors == ["main.py:2: error: Revealed type is 'django.db.models.manager.RelatedManager[b.models.Book]'"]
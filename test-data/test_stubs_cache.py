@@ -0,0 +1,77 @@
+"""
+Build and install of the prebuilt cache of django-stubs, see mypy_django_plugin/stubs_cache.py.
+"""
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+from mypy import api
+
+from mypy_django_plugin import stubs_cache
+
+PLUGINS_INI_FPATH = Path(__file__).parent / 'plugins.ini'
+MYPY_ARGS = ['--config-file', str(PLUGINS_INI_FPATH), '--no-silence-site-packages']
+PYTHON_VERSION_DIR = '{}.{}'.format(*sys.version_info[:2])
+
+
+def test_stub_modules_of_directories_without_init_file_are_skipped(tmp_path):
+    for fname in ['__init__.pyi', 'conf/__init__.pyi', 'conf/global_settings.pyi',
+                  'views/csrf.pyi', 'views/generic/__init__.pyi', 'views/generic/base.pyi']:
+        (tmp_path / fname).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / fname).write_text('')
+
+    assert stubs_cache.get_stub_modules(tmp_path) == ['django', 'django.conf', 'django.conf.global_settings']
+
+
+@pytest.fixture(scope='module')
+def bundles_directory(tmp_path_factory):
+    # built once, in a project without plugin configuration
+    build_directory = tmp_path_factory.mktemp('build')
+    prev_cwd = os.getcwd()
+    os.chdir(str(build_directory))
+    try:
+        stubs_cache.build_bundle(build_directory / 'bundles', MYPY_ARGS)
+    finally:
+        os.chdir(prev_cwd)
+    return build_directory / 'bundles'
+
+
+@pytest.fixture
+def project_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('MYPY_DJANGO_CONFIG', raising=False)
+    monkeypatch.delenv('DJANGO_SETTINGS_MODULE', raising=False)
+    (tmp_path / 'main.py').write_text('from django.db import models\n'
+                                      'class Publisher(models.Model):\n'
+                                      '    pass\n'
+                                      'reveal_type(Publisher.objects)\n')
+    return tmp_path
+
+
+def test_installed_bundle_is_used_by_mypy_instead_of_analyzing_stubs(bundles_directory, project_directory):
+    # bundle is moved to another directory, and installed into a project at another path than it was built in
+    relocated_bundles_directory = project_directory / 'relocated_bundles'
+    shutil.copytree(str(bundles_directory), str(relocated_bundles_directory), copy_function=shutil.copy2)
+    cache_directory = project_directory / '.mypy_cache'
+    assert stubs_cache.install_bundle(relocated_bundles_directory, cache_directory) is not None
+
+    data_fpath = cache_directory / PYTHON_VERSION_DIR / 'django' / 'db' / 'models' / 'base.data.json'
+    installed_mtime = data_fpath.stat().st_mtime_ns
+
+    stdout, stderr, _ = api.run([*MYPY_ARGS, '--cache-dir', str(cache_directory), 'main.py'])
+    assert not stderr, stderr
+    assert stdout.splitlines() == [
+        "main.py:4: error: Revealed type is 'django.db.models.manager.Manager[main.Publisher]'",
+    ]
+    # data files are written again only for modules which are analyzed
+    assert data_fpath.stat().st_mtime_ns == installed_mtime
+
+
+def test_bundle_is_not_installed_for_other_plugin_settings(bundles_directory, project_directory, monkeypatch):
+    (project_directory / 'mysettings.py').write_text('INSTALLED_APPS = []\n')
+    monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'mysettings')
+
+    assert stubs_cache.install_bundle(bundles_directory, project_directory / '.mypy_cache') is None
+    assert not (project_directory / '.mypy_cache').exists()